@@ -1,32 +1,52 @@
 from transformers import ReactCodeAgent, HfApiEngine
-from prompts import *
+from transformers.agents.agents import (
+    LIST_SAFE_MODULES,
+    format_prompt_with_tools,
+    format_prompt_with_managed_agents_descriptions,
+    format_prompt_with_imports,
+)
+from prompts import DEFAULT_SQUAD_REACT_CODE_SYSTEM_PROMPT
 from tools.squad_tools import SquadRetrieverTool, SquadQueryTool
-from transformers.agents.llm_engine import MessageRole, get_clean_message_list
-from openai import OpenAI
+from engines import OpenAIModel, CachedEngine
+from telemetry import telemetry
 
 DEFAULT_TASK_SOLVING_TOOLBOX = [SquadRetrieverTool()] # , SquadQueryTool()
 
-openai_role_conversions = {
-    MessageRole.TOOL_RESPONSE: MessageRole.USER,
-}
+class SquadReactCodeAgent(ReactCodeAgent):
+    """
+    A ReactCodeAgent whose system prompt is byte-identical on every run, in every process.
+    ReactCodeAgent lists the authorized imports in set order, which changes with Python's
+    hash seed, so each app restart or worker would send a different prompt prefix, and miss
+    the provider's prompt cache (and our LLM response cache).
 
-class OpenAIModel:
-    def __init__(self, model_name="gpt-4o-mini-2024-07-18"):
-        self.model_name = model_name
-        self.client = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"),
-        )
+    Each step, and each Python interpreter run within it, is timed as a telemetry span.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        evaluate = self.python_evaluator
+
+        def timed_evaluate(*args, **kwargs):
+            with telemetry.span("interpreter"):
+                return evaluate(*args, **kwargs)
 
-    def __call__(self, messages, stop_sequences=[]):
-        messages = get_clean_message_list(messages, role_conversions=openai_role_conversions)
+        self.python_evaluator = timed_evaluate
 
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=messages,
-            stop=stop_sequences,
-            temperature=0.5
+    def step(self):
+        with telemetry.span("step"):
+            return super().step()
+
+    def initialize_for_run(self):
+        super().initialize_for_run()
+        system_prompt = format_prompt_with_tools(
+            self._toolbox, self.system_prompt_template, self.tool_description_template
+        )
+        system_prompt = format_prompt_with_managed_agents_descriptions(system_prompt, self.managed_agents)
+        self.system_prompt = format_prompt_with_imports(
+            system_prompt, sorted(set(LIST_SAFE_MODULES) | set(self.authorized_imports))
         )
-        return response.choices[0].message.content
+        self.logs[0]["system_prompt"] = self.system_prompt
+
 
 def get_agent(
     model_name=None,
@@ -34,15 +54,18 @@ def get_agent(
     toolbox=DEFAULT_TASK_SOLVING_TOOLBOX,
     use_openai=True,
     openai_model_name="gpt-4o-mini-2024-07-18",
+    llm_cache_mode=None,
 ):
     DEFAULT_MODEL_NAME = "http://localhost:1234/v1"
     if model_name is None:
         model_name = DEFAULT_MODEL_NAME
 
     llm_engine = HfApiEngine(model_name) if not use_openai else OpenAIModel(openai_model_name)
+    # Record, replay or pass through LLM responses (SQUAD_LLM_CACHE, "passthrough" by default)
+    llm_engine = CachedEngine(llm_engine, mode=llm_cache_mode)
 
     # Initialize the agent with both tools
-    agent = ReactCodeAgent(
+    agent = SquadReactCodeAgent(
         tools=toolbox,
         llm_engine=llm_engine,
         system_prompt=system_prompt,
@@ -0,0 +1,99 @@
+import os
+import time
+import queue
+import threading
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+
+'''
+A bounded pool of agents, so the app can run several sessions at once without them sharing
+(and overwriting) one agent's logs. Agents are cheap wrappers: the toolbox with its loaded
+index and retriever, and the LLM client, are shared by every agent the factory creates.
+A session checks an agent out with its own logs, and the agent is cleared when it returns.
+'''
+
+
+class PoolTimeout(TimeoutError):
+    pass
+
+
+class AgentPool:
+    """
+    Creates up to size agents with factory() as they are needed. checkout() waits up to
+    timeout seconds (forever if None) for a free agent, and the time spent waiting is kept
+    for stats().
+    """
+
+    def __init__(self, factory, size=None, timeout=None, history=1000):
+        self.factory = factory
+        self.size = size or int(os.getenv("SQUAD_AGENT_POOL_SIZE", 4))
+        self.timeout = timeout if timeout is not None else float(os.getenv("SQUAD_AGENT_CHECKOUT_TIMEOUT", 120))
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.created = 0
+        self.in_use = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.waits = deque(maxlen=history)
+
+    def acquire(self):
+        start = time.perf_counter()
+        try:
+            agent = self.idle.get_nowait()
+        except queue.Empty:
+            agent = None
+            with self.lock:
+                create = self.created < self.size
+                if create:
+                    self.created += 1
+            if create:
+                try:
+                    agent = self.factory()
+                except BaseException:
+                    with self.lock:
+                        self.created -= 1
+                    raise
+            else:
+                try:
+                    agent = self.idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self.lock:
+                        self.timeouts += 1
+                    raise PoolTimeout(f"No agent was free within {self.timeout}s ({self.size} in use)")
+        with self.lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.waits.append(time.perf_counter() - start)
+        return agent
+
+    def release(self, agent):
+        # Don't keep a session's history on an idle agent
+        agent.logs = []
+        with self.lock:
+            self.in_use -= 1
+        self.idle.put(agent)
+
+    @contextmanager
+    def checkout(self, logs=None):
+        """Lends an agent holding the given session logs (a fresh session if None)."""
+        agent = self.acquire()
+        try:
+            agent.logs = logs if logs is not None else []
+            yield agent
+        finally:
+            self.release(agent)
+
+    def stats(self):
+        waits = list(self.waits)
+        return {
+            "size": self.size,
+            "created": self.created,
+            "in_use": self.in_use,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            **{
+                f"wait_p{p}": float(np.percentile(waits, p)) if waits else 0.0
+                for p in (50, 95, 99)
+            },
+        }
@@ -1,20 +1,25 @@
 import gradio as gr
 from gradio import ChatMessage
-from utils import stream_from_transformers_agent
+from utils import stream_from_transformers_agent, PartialOutput, MonologueFragment
 from gradio.context import Context
 from gradio import Request
-import pickle
 import os
+import time
+import logging
 from dotenv import load_dotenv
 from agent import get_agent, DEFAULT_TASK_SOLVING_TOOLBOX
+from agent_pool import AgentPool
+from session_store import SessionStore
+from compaction import compact_logs
+from telemetry import telemetry
 from transformers.agents import (
     DuckDuckGoSearchTool,
     ImageQuestionAnsweringTool,
     VisitWebpageTool,
 )
 from tools.text_to_image import TextToImageTool
+from tools.lazy_tool import LazyTool, warm_up
 from PIL import Image
-from transformers import load_tool
 from prompts import (
     DEFAULT_SQUAD_REACT_CODE_SYSTEM_PROMPT,
     FOCUSED_SQUAD_REACT_CODE_SYSTEM_PROMPT,
@@ -24,14 +29,25 @@ from pygments.formatters import HtmlFormatter
 
 load_dotenv()
 
+logging.basicConfig(
+    level=os.getenv("SQUAD_LOG_LEVEL", "INFO"),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger("app")
+
+# Per-phase latency histograms, token counts and cache hits, as Prometheus text at /metrics
+if os.getenv("SQUAD_METRICS_PORT"):
+    telemetry.serve(host=os.getenv("SQUAD_METRICS_HOST", "127.0.0.1"), port=int(os.getenv("SQUAD_METRICS_PORT")))
+
 SESSION_PERSISTENCE_ENABLED = os.getenv("SESSION_PERSISTENCE_ENABLED", False)
 
-sessions_path = "sessions.pkl"
-sessions = (
-    pickle.load(open(sessions_path, "rb"))
-    if SESSION_PERSISTENCE_ENABLED and os.path.exists(sessions_path)
-    else {}
-)
+sessions_path = "sessions.sqlite"
+sessions = SessionStore(sessions_path if SESSION_PERSISTENCE_ENABLED else None)
+# Bring over sessions from the whole-dict pickle earlier versions wrote
+legacy_sessions_path = "sessions.pkl"
+if SESSION_PERSISTENCE_ENABLED and os.path.exists(legacy_sessions_path):
+    logger.info("Imported %d entries from %s", sessions.import_pickle(legacy_sessions_path), legacy_sessions_path)
+    os.replace(legacy_sessions_path, legacy_sessions_path + ".imported")
 
 # If currently hosted on HuggingFace Spaces, use the default model, otherwise use the local model
 model_name = (
@@ -49,27 +65,40 @@ class FixImageQuestionAnsweringTool(ImageQuestionAnsweringTool):
             image = Image.open(image)
         return super().encode(image, question)
 
+# Most chats never use these, so each is created (with its model) on its first call
 ADDITIONAL_TOOLS = [
-    DuckDuckGoSearchTool(),
-    VisitWebpageTool(),
-    FixImageQuestionAnsweringTool(),
-    load_tool("speech_to_text"),
-    load_tool("text_to_speech"),
-    load_tool("translation"),
-    TextToImageTool(),
+    LazyTool(DuckDuckGoSearchTool),
+    LazyTool(VisitWebpageTool),
+    LazyTool(FixImageQuestionAnsweringTool),
+    LazyTool.from_task("speech_to_text"),
+    LazyTool.from_task("text_to_speech"),
+    LazyTool.from_task("translation"),
+    LazyTool(TextToImageTool),
 ]
 
+# Optionally load them in the background once the app is up, so first calls don't wait
+if os.getenv("SQUAD_WARM_UP_TOOLS", "0") != "0":
+    warm_up(ADDITIONAL_TOOLS)
+
+# Load the index now, rather than on the first chat's first search
+for tool in DEFAULT_TASK_SOLVING_TOOLBOX:
+    tool.setup()
+
 # Add image tools to the default task solving toolbox, for a more visually interactive experience
 TASK_SOLVING_TOOLBOX = DEFAULT_TASK_SOLVING_TOOLBOX + ADDITIONAL_TOOLS
 
 # system_prompt = DEFAULT_SQUAD_REACT_CODE_SYSTEM_PROMPT
 system_prompt = FOCUSED_SQUAD_REACT_CODE_SYSTEM_PROMPT
 
-agent = get_agent(
-    model_name=model_name,
-    toolbox=TASK_SOLVING_TOOLBOX,
-    system_prompt=system_prompt,
-    use_openai=True,  # Use OpenAI instead of a local or HF model as the base LLM engine
+# Each session borrows an agent from the pool for a turn, so sessions run in parallel without
+# sharing logs. The agents share the toolbox (and its loaded index) and the LLM client.
+agent_pool = AgentPool(
+    lambda: get_agent(
+        model_name=model_name,
+        toolbox=TASK_SOLVING_TOOLBOX,
+        system_prompt=system_prompt,
+        use_openai=True,  # Use OpenAI instead of a local or HF model as the base LLM engine
+    )
 )
 
 app = None
@@ -97,18 +126,38 @@ def add_message(message, messages):
 def interact_with_agent(messages, request: Request):
     session_hash = request.session_hash
     prompt = messages[-1]["content"]
-    agent.logs = sessions.get(session_hash + "_logs", [])
+    # Time the whole turn, including waits for the agent pool and the client. The generator may
+    # resume on a different thread after each yield, so this isn't a span() around the body
+    start = time.perf_counter()
+    turn = {"phase": "turn", "trace": telemetry.new_trace(), "start": time.time()}
     yield messages, gr.update(
         value="<center><h1>Thinking...</h1></center>", visible=True
     )
-    for msg in stream_from_transformers_agent(agent, prompt):
-        if isinstance(msg, ChatMessage):
-            messages.append(msg)
-            yield messages, gr.update(visible=True)
-        else:
-            yield messages, gr.update(
-                value=f"<center><h1>{msg}</h1></center>", visible=True
-            )
+    # Keep the history resent with every LLM call within budget, however long the chat gets
+    with telemetry.span("compaction", trace=turn["trace"]) as span:
+        logs, report = compact_logs(sessions.get(session_hash).get("logs", []))
+        span["history_tokens"] = report["after"]
+    if report["before"] != report["after"]:
+        logger.info("Compacted the history of %s from %d to %d tokens", session_hash, report["before"], report["after"])
+    with agent_pool.checkout(logs=logs) as agent:
+        for msg in stream_from_transformers_agent(agent, prompt, trace=turn["trace"]):
+            if isinstance(msg, ChatMessage):
+                messages.append(msg)
+                yield messages, gr.update(visible=True)
+            # Only the chat messages above change the chatbot; for the rest, leave it as it is
+            # (an empty update) rather than sending the whole conversation again
+            elif isinstance(msg, PartialOutput):
+                # The rationale and code of the current step, as the LLM writes them
+                yield gr.update(), gr.update(value=f"<h2>🧠 Thinking...</h2>\n\n{msg.text}", visible=True)
+            elif isinstance(msg, MonologueFragment):
+                # Just the step's latest message; the whole monologue is added to the chat at the end
+                yield gr.update(), gr.update(value=msg.html, visible=True)
+            else:
+                yield gr.update(), gr.update(
+                    value=f"<center><h1>{msg}</h1></center>", visible=True
+                )
+        sessions.update(session_hash, logs=agent.logs)
+    telemetry.record(turn, time.perf_counter() - start)
     yield messages, gr.update(value="<center><h1>Idle</h1></center>", visible=False)
 
 
@@ -116,18 +165,14 @@ def persist(component):
 
     def resume_session(value, request: Request):
         session_hash = request.session_hash
-        print(f"Resuming session for {session_hash}")
-        state = sessions.get(session_hash, value)
-        agent.logs = sessions.get(session_hash + "_logs", [])
+        logger.debug("Resuming session for %s", session_hash)
+        state = sessions.get(session_hash).get("chat", value)
         return state
 
     def update_session(value, request: Request):
         session_hash = request.session_hash
-        print(f"Updating persisted session state for {session_hash}")
-        sessions[session_hash] = value
-        sessions[session_hash + "_logs"] = agent.logs
-        if SESSION_PERSISTENCE_ENABLED:
-            pickle.dump(sessions, open(sessions_path, "wb"))
+        logger.debug("Updating persisted session state for %s", session_hash)
+        sessions.update(session_hash, chat=value)
 
     Context.root_block.load(resume_session, inputs=[component], outputs=component)
     component.change(update_session, inputs=[component], outputs=None)
@@ -158,9 +203,9 @@ class CleanChatBot(Chatbot):
         ),
     ) -> str | FileMessage | ComponentMessage | None:
         response = super()._postprocess_content(chat_message)
-        print(f"Post processing content: {response}")
+        logger.debug("Post processing content: %s", response)
         if isinstance(response, ComponentMessage):
-            print(f"Setting open to False for {response}")
+            logger.debug("Setting open to False for %s", response)
             response.props["open"] = False
         return response
 
@@ -215,5 +260,8 @@ with gr.Blocks(
         interact_with_agent, [chatbot], [chatbot, inner_monologue_component]
     )
 
+# Run as many chat turns at once as there are agents to serve them
+demo.queue(default_concurrency_limit=agent_pool.size)
+
 if __name__ == "__main__":
     demo.launch()
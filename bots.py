@@ -1,4 +1,7 @@
-from data import Data
+import logging
+from data import get_data
+
+logger = logging.getLogger(__name__)
 
 '''
 The BotWrapper class makes it so that different types of bots can be used in the same way.
@@ -12,7 +15,7 @@ class BotWrapper:
         methods = ['chat', 'query']
         for method in methods:
             if hasattr(self.bot, method):
-                print(f"Calling {method} method")
+                logger.debug("Calling %s method", method)
                 method_to_call = getattr(self.bot, method)
                 return method_to_call(*args, **kwargs).response()
         raise AttributeError(f"'{self.bot.__class__.__name__}' object has none of the required methods: '{methods}'")  
@@ -21,7 +24,7 @@ class BotWrapper:
         methods = ['stream_chat', 'query']
         for method in methods:
             if hasattr(self.bot, method):
-                print(f"Calling {method} method")
+                logger.debug("Calling %s method", method)
                 method_to_call = getattr(self.bot, method)
                 return method_to_call(*args, **kwargs).response_gen
         raise AttributeError(f"'{self.bot.__class__.__name__}' object has none of the required methods: '{methods}'")   
@@ -31,8 +34,7 @@ The Bots class creates the bots and passes them to the frontend.
 '''
 class Bots:
     def __init__(self):
-        self.data = Data()
-        self.data.load_data()
+        self.data = get_data(download=True)
         self.query_engine = None
         self.chat_agent = None
         self.all_bots = None
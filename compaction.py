@@ -0,0 +1,87 @@
+import os
+from tokens import count_tokens, truncate_tokens
+
+'''
+Compaction of agent logs between chat turns. Agents run with reset=False after the first
+turn, so every past step, with its full retriever observation, would otherwise be resent
+with each new turn. Compaction keeps the latest steps verbatim and, while the history is
+over budget, shortens older observations and collapses earlier turns into their task and
+final answer.
+'''
+
+# Step log fields that write_inner_memory_from_logs puts into the prompt
+PROMPT_FIELDS = ("task", "llm_output", "facts", "plan", "observation", "error")
+TRUNCATED = "\n[... truncated to save space]"
+
+
+def history_tokens(logs):
+    """Tokens the logs add to the prompt, besides the system prompt."""
+    return sum(
+        count_tokens(str(step[field]))
+        for step in logs
+        for field in PROMPT_FIELDS
+        if step.get(field) is not None
+    )
+
+
+def split_turns(logs):
+    """Splits logs into turns, each starting with the step log holding its task."""
+    turns = []
+    for step in logs:
+        if "task" in step or not turns:
+            turns.append([])
+        turns[-1].append(step)
+    return turns
+
+
+def summarize_turn(turn):
+    """Collapses a finished turn into its task and final answer."""
+    start = dict(turn[0])
+    final_answer = next((step["final_answer"] for step in reversed(turn) if "final_answer" in step), None)
+    steps = len(turn) - 1
+    summary = {
+        "llm_output": f"Thought: I worked on this task in {steps} steps (details omitted to save space).",
+        "observation": f"Final answer: {final_answer}" if final_answer is not None else "No final answer was given.",
+    }
+    if final_answer is not None:
+        summary["final_answer"] = final_answer
+    return [start, summary]
+
+
+def truncate_observation(step, max_tokens):
+    observation = step.get("observation")
+    if observation is None or count_tokens(observation) <= max_tokens:
+        return step
+    return {**step, "observation": truncate_tokens(observation, max_tokens) + TRUNCATED}
+
+
+def compact_logs(logs, max_tokens=None, keep_recent_steps=None, observation_tokens=200):
+    """
+    Returns (compacted logs, {"before": tokens, "after": tokens}). The agent_memory snapshots
+    kept on each step (never part of the prompt) are always dropped. Then, while over
+    max_tokens: observations older than the last keep_recent_steps steps are truncated to
+    observation_tokens, and turns before the last are collapsed, oldest first.
+    """
+    max_tokens = max_tokens or int(os.getenv("SQUAD_HISTORY_MAX_TOKENS", 3000))
+    keep_recent_steps = keep_recent_steps if keep_recent_steps is not None else int(
+        os.getenv("SQUAD_HISTORY_RECENT_STEPS", 4)
+    )
+    before = history_tokens(logs)
+    logs = [{k: v for k, v in step.items() if k != "agent_memory"} for step in logs]
+
+    if history_tokens(logs) > max_tokens:
+        recent = len(logs) - keep_recent_steps
+        logs = [
+            truncate_observation(step, observation_tokens) if i < recent else step
+            for i, step in enumerate(logs)
+        ]
+
+    turns = split_turns(logs)
+    turn_tokens = [history_tokens(turn) for turn in turns]
+    for i in range(len(turns) - 1):
+        if sum(turn_tokens) <= max_tokens:
+            break
+        turns[i] = summarize_turn(turns[i])
+        turn_tokens[i] = history_tokens(turns[i])
+    logs = [step for turn in turns for step in turn]
+    return logs, {"before": before, "after": history_tokens(logs)}
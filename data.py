@@ -1,124 +1,329 @@
 import os
+import logging
+import re
 import json
-import chromadb
-import pandas as pd
-from llama_index.core import VectorStoreIndex
-from llama_index.vector_stores.chroma import ChromaVectorStore
-from llama_index.core import StorageContext
-from llama_index.core import Document
+import hashlib
+from index_builder import IndexBuilder, read_manifest
 
 from dotenv import load_dotenv
 
 load_dotenv()  # Load OPENAI_API_KEY from .env (not included in repo)
 
-import gdown
+logger = logging.getLogger(__name__)
+
+# pandas, llama-index and gdown are imported where they are used, so importing this module
+# (e.g. for format_document) stays cheap
 
 data = None
 def get_data(download=False):
     global data
     if data is None:
         data = Data(download)
+    elif download and not data.downloaded:
+        data.download_data()
     return data
 
+SQUAD_PATH = "data/train-v1.1.json"
+CACHE_DIR = "data/cache"
+QA_COLUMNS = ["Title", "Context", "Question", "Answers"]
+# Bump when iter_squad_qas or QA_COLUMNS change, so older caches are not served
+QA_CACHE_VERSION = 1
+CHROMA_PATH = "./chroma_db"
+# Local sentence-transformers model used for embeddings, e.g. "sentence-transformers/all-mpnet-base-v2".
+# Unset, llama-index's default (OpenAI) embeddings are used.
+EMBED_MODEL = os.getenv("SQUAD_EMBED_MODEL")
+
+def collection_name(embed_model=EMBED_MODEL):
+    """Each embedding model gets its own collection, since their vectors are not comparable."""
+    if embed_model is None:
+        return "squad_paragraphs"
+    # Chroma collection names allow [a-zA-Z0-9._-], so keep the full model id, sanitized
+    return "squad_paragraphs_" + re.sub(r"[^a-zA-Z0-9_-]", "_", embed_model)
+
+COLLECTION_NAME = collection_name()
+# Google Drive file id of a zipped ./chroma_db holding COLLECTION_NAME, if one has been published
+INDEX_ARCHIVE_ID = os.getenv("SQUAD_INDEX_ARCHIVE_ID")
+
+def configure_embed_model(embed_model=EMBED_MODEL):
+    if embed_model is not None:
+        from llama_index.core import Settings
+        from embeddings import LocalEmbedding
+        Settings.embed_model = LocalEmbedding(embed_model)
+
+# Bump when format_document or paragraph_document change, so existing indexes are flagged stale
+DOCUMENT_VERSION = 2
+
+def source_stamp(path=SQUAD_PATH):
+    """Identifies a version of the raw data file from its size and mtime, without reading it."""
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def file_hash(path, chunk_size=1 << 20):
+    """Returns the sha256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def iter_squad_articles(f):
+    """Yields the articles of a SQuAD file, incrementally if ijson is installed."""
+    try:
+        import ijson
+    except ImportError:
+        yield from json.load(f)["data"]
+        return
+    yield from ijson.items(f, "data.item")
+
+def iter_squad_qas(path=SQUAD_PATH):
+    """Yields (title, context, question, answers) for every question in a SQuAD file."""
+    with open(path, "rb") as f:
+        for article in iter_squad_articles(f):
+            title = article["title"]
+            for par in article["paragraphs"]:
+                context = par["context"]
+                for qa in par["qas"]:
+                    answers = []
+                    for ans in qa["answers"]:
+                        if ans["text"] not in answers:
+                            answers.append(ans["text"])
+                    yield title, context, qa["question"], answers
+
+def load_squad_qas(path=SQUAD_PATH, cache_dir=CACHE_DIR):
+    """
+    Loads one row per question from a SQuAD file.
+    The parsed table is cached as Parquet, keyed on the hash of the source file and the
+    cache version, so later starts skip the JSON parse entirely.
+    """
+    prefix = f"{os.path.basename(path)}."
+    cache_path = os.path.join(
+        cache_dir, f"{prefix}v{QA_CACHE_VERSION}.{file_hash(path)[:16]}.parquet"
+    )
+    import pandas as pd
+    if os.path.exists(cache_path):
+        logger.info("Loading cached SQuAD data from %s", cache_path)
+        return pd.read_parquet(cache_path)
+
+    logger.info("Parsing %s...", path)
+    qas = pd.DataFrame(iter_squad_qas(path), columns=QA_COLUMNS)
+    tmp_path = cache_path + ".tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        qas.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+        logger.info("Cached SQuAD data to %s", cache_path)
+        # Remove caches of earlier versions of the source file
+        for filename in os.listdir(cache_dir):
+            if filename.startswith(prefix) and filename != os.path.basename(cache_path):
+                os.remove(os.path.join(cache_dir, filename))
+    except (ImportError, OSError) as e:
+        # The cache is an optimization; a missing pyarrow or read-only disk shouldn't stop loading
+        logger.warning("Not caching SQuAD data: %s", e)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return qas
+
+def format_document(title, context):
+    """Formats a paragraph with its title, as shown in retrieval results."""
+    return f"Title: {title}\nContext: {context}"
+
+def format_qas(qas):
+    """Formats the questions linked to a paragraph, as listed under it in retrieval results."""
+    return "\n".join(
+        f"Question: {qa['question']}\nAcceptable Answers:\n"
+        f"{[f'{i+1}. {ans}' for i, ans in enumerate(qa['answers'])]}"
+        for qa in qas
+    )
+
+def paragraph_document(title, context, paragraph_id, questions, answers):
+    """
+    Builds one Document per paragraph, holding only the context as text. The article title,
+    paragraph id and the linked questions and answers are stored as metadata, so retrieval
+    can filter on them; only the title is part of the embedding, so each paragraph is only
+    embedded once.
+    """
+    from llama_index.core import Document
+    qas = [
+        {"question": question, "answers": list(ans)}
+        for question, ans in zip(questions, answers)
+    ]
+    return Document(
+        text=context,
+        metadata={
+            "title": title,
+            "paragraph_id": paragraph_id,
+            "qas": json.dumps(qas, ensure_ascii=False),
+        },
+        # Chat and query engines get the title and paragraph, not the raw JSON
+        excluded_embed_metadata_keys=["paragraph_id", "qas"],
+        excluded_llm_metadata_keys=["paragraph_id", "qas"],
+    )
+
+def paragraph_documents(qas):
+    """Groups a question table into paragraph Documents, numbering paragraphs within each article."""
+    documents = []
+    paragraphs_per_title = {}
+    for (title, context), group in qas.groupby(["Title", "Context"], sort=False):
+        number = paragraphs_per_title[title] = paragraphs_per_title.get(title, -1) + 1
+        documents.append(
+            paragraph_document(title, context, f"{title}/{number}", group["Question"], group["Answers"])
+        )
+    return documents
+
+def open_index_builder():
+    """Opens the Chroma collection, refusing to serve one that was never built."""
+    builder = IndexBuilder(path=CHROMA_PATH, collection_name=COLLECTION_NAME)
+    if builder.collection.count() == 0:
+        # Embedding the whole corpus takes far too long to do while serving
+        raise RuntimeError(
+            f"The {COLLECTION_NAME} collection in {CHROMA_PATH} is empty. "
+            "Build it first with `python index_builder.py`."
+        )
+    return builder
+
 class Data:
+    """
+    Holds the SQuAD corpus and its vector index. The raw corpus (qas, df, documents) and
+    the index are loaded lazily on first access, so a process that only serves queries
+    opens the persisted vector store without ever parsing the raw dataset.
+    """
     def __init__(self, download=False):
-        print("Initializing Data...")
-        print(f"Download: {download}")
+        logger.debug("Initializing Data...")
+        logger.debug("Download: %s", download)
         self.client = None
         self.collection = None
-        self.index = None
+        self._qas = None
+        self._df = None
+        self._documents = None
+        self._index = None
+        self._exported_indexes = {}
+        self._titles = None
+        self.downloaded = False
+        configure_embed_model()
         if download:
             self.download_data()
-        self.load_data()
 
     def download_data(self):
-        # Download the already indexed data
-        if not os.path.exists("./chroma_db"):
+        # Download the already indexed data, if an archive of the paragraph collection has been
+        # published. The original archive only held the legacy per-question "simple_index"
+        # collection, which nothing reads any more.
+        self.downloaded = True
+        if not os.path.exists(CHROMA_PATH) and INDEX_ARCHIVE_ID is not None:
             try: 
-                print("Downloading data...")
-                file_id = "1JvYQ9E5zDBKRCUKkxejDvp7UGwzxDAUW"
-                url = f"https://drive.google.com/uc?export=download&id={file_id}"
+                import gdown
+                logger.info("Downloading data...")
+                url = f"https://drive.google.com/uc?export=download&id={INDEX_ARCHIVE_ID}"
                 output = "chroma_db.zip"
                 gdown.download(url, output, quiet=False)
-                print("Unzipping data...")
+                logger.info("Unzipping data...")
                 os.system("unzip chroma_db.zip")
             except Exception as e:
-                print(f"Error downloading data: {e}")
+                logger.error("Error downloading data: %s", e)
 
-        return os.path.exists("./chroma_db")
+        return os.path.exists(CHROMA_PATH)
 
-    def load_data(self):
-        print("Loading data...")
-    
-        with open('data/train-v1.1.json', 'r') as f:
-            raw_data = json.load(f)  
-            
-        raw_documents = []
-        documents = []
-
-        for data in raw_data['data']:
-            title = data['title']
-            for par in data['paragraphs']:
-                context = par['context']
-                for qa in par['qas']:
-                    question = qa['question']
-                    answers = []
-                    for ans in qa['answers']:
-                        if ans['text'] not in answers:
-                            answers.append(ans['text'])
-                    for answer in answers:
-                        raw_documents.append([title, context, question, answer])
-                    
-                    doc = f"""
-                        Title: {title}
-                        Context: {context}
-                        Question: {question}
-                        Acceptable Answers:
-                        {[f"{i+1}. {ans}" for i, ans in enumerate(answers)]}
-                    """
-                    # Remove padding on each line
-                    doc = "\n".join([line.strip() for line in doc.split("\n")])
-                    documents.append(doc)
-
-        self.df = pd.DataFrame(raw_documents, columns=["Title", "Context", "Question", "Answer"])
-        self.documents = [Document(text=t) for t in documents]
-
-        print("Raw Data loaded")
-
-        if not os.path.exists("./chroma_db"):
-            # Attempt to generate an index from the raw data
-            print("Creating Chroma DB...")
-            # initialize client, setting path to save data
-            self.client = chromadb.PersistentClient(path="./chroma_db")
-
-            # create collection
-            self.collection = self.client.get_or_create_collection("simple_index")
-
-            # assign chroma as the vector_store to the context
-            vector_store = ChromaVectorStore(chroma_collection=self.collection)
-            storage_context = StorageContext.from_defaults(vector_store=vector_store)
-
-            # create your index
-            self.index = VectorStoreIndex.from_documents(
-                self.documents, storage_context=storage_context
+    @property
+    def qas(self):
+        if self._qas is None:
+            logger.info("Loading data...")
+            self._qas = load_squad_qas()
+            logger.info("Raw Data loaded")
+        return self._qas
+
+    @property
+    def df(self):
+        if self._df is None:
+            # One row per distinct answer, matching the layout used by the benchmarks
+            self._df = (
+                self.qas.explode("Answers")
+                .dropna(subset=["Answers"])
+                .rename(columns={"Answers": "Answer"})
+                .reset_index(drop=True)
             )
-            print("Chroma DB created")
-        else:
-            print("Chroma DB already exists")
+        return self._df
 
-        print("Loading index...")
-        # initialize client
-        self.client = chromadb.PersistentClient(path="./chroma_db")
+    @property
+    def documents(self):
+        if self._documents is None:
+            self._documents = paragraph_documents(self.qas)
+        return self._documents
 
-        # get collection
-        self.collection = self.client.get_or_create_collection("simple_index")
+    @property
+    def index(self):
+        if self._index is None:
+            self.load_index()
+        return self._index
+
+    def load_data(self):
+        """Eagerly loads the raw corpus and the index."""
+        # Reading the lazy properties loads them
+        self.df
+        self.documents
+        if self._index is None:
+            self.load_index()
+        return self
+
+    def load_index(self):
+        from llama_index.core import StorageContext, VectorStoreIndex
+        from llama_index.vector_stores.chroma import ChromaVectorStore
+        builder = open_index_builder()
+        # Only stat the raw file; updating the index is left to index_builder.py
+        source = source_stamp()
+        if source is not None and builder.needs_build(source=source, version=DOCUMENT_VERSION):
+            logger.warning("Chroma DB is out of date with %s; run `python index_builder.py` to update it", SQUAD_PATH)
+
+        logger.info("Loading index...")
+        self.client = builder.client
+        self.collection = builder.collection
 
         # assign chroma as the vector_store to the context
         vector_store = ChromaVectorStore(chroma_collection=self.collection)
         storage_context = StorageContext.from_defaults(vector_store=vector_store)
 
         # load your index from stored vectors
-        self.index = VectorStoreIndex.from_vector_store(
+        self._index = VectorStoreIndex.from_vector_store(
             vector_store, storage_context=storage_context
         )
-        print("Index loaded")
\ No newline at end of file
+        logger.info("Index loaded")
+
+    def titles(self, page_size=10000):
+        """The distinct article titles in the collection."""
+        if self._titles is None:
+            self.index
+            titles = set()
+            offset = 0
+            while True:
+                page = self.collection.get(include=["metadatas"], limit=page_size, offset=offset)
+                titles.update(m.get("title") for m in page["metadatas"] if m and m.get("title"))
+                if len(page["ids"]) < page_size:
+                    break
+                offset += page_size
+            self._titles = sorted(titles)
+        return self._titles
+
+    def vector_index(self, backend="flat"):
+        """Opens an in-process vector index (see retrieval.VECTOR_INDEXES) of the collection."""
+        from retrieval import VECTOR_INDEXES
+        return self.exported_index(backend, VECTOR_INDEXES[backend])
+
+    def lexical_index(self):
+        """Opens the BM25 keyword index of the collection."""
+        from retrieval import BM25Index
+        return self.exported_index("bm25", BM25Index)
+
+    def exported_index(self, name, index_class):
+        """
+        Opens an in-process index stored next to the Chroma collection. It is exported from
+        the collection when missing, or when the collection has been rebuilt since; otherwise
+        Chroma is never opened.
+        """
+        if name not in self._exported_indexes:
+            path = os.path.join(CHROMA_PATH, f"{COLLECTION_NAME}.{name}")
+            corpus = read_manifest(CHROMA_PATH).get(COLLECTION_NAME, {}).get("corpus_hash")
+            index = index_class(path) if index_class.exists(path) else None
+            if index is None or index.corpus_hash != corpus:
+                index = index_class.from_collection(open_index_builder().collection, path, corpus_hash=corpus)
+            self._exported_indexes[name] = index
+        return self._exported_indexes[name]
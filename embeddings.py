@@ -0,0 +1,98 @@
+import os
+import numpy as np
+import torch
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from llama_index.core.embeddings import BaseEmbedding
+from pydantic import PrivateAttr
+from semscore import EmbeddingModelWrapper
+
+'''
+Local sentence-transformers embeddings, both for serving (LocalEmbedding plugs into
+llama-index, so queries are embedded with the same model as the index) and for
+offline index builds (ParallelEmbedder spreads batches over a pool of CPU workers).
+'''
+
+
+def embed_texts(model, texts):
+    """Embeds texts with an EmbeddingModelWrapper, L2-normalized so dot products are cosine similarities."""
+    embeddings = model.get_embeddings(texts)
+    embeddings = torch.nn.functional.normalize(embeddings, dim=1)
+    return embeddings.cpu().numpy().astype(np.float32)
+
+
+class LocalEmbedding(BaseEmbedding):
+    _model: EmbeddingModelWrapper = PrivateAttr()
+
+    def __init__(self, model_name=EmbeddingModelWrapper.DEFAULT_MODEL, device=None, **kwargs):
+        super().__init__(model_name=model_name, **kwargs)
+        self._model = EmbeddingModelWrapper(model_name, bs=self.embed_batch_size, device=device)
+
+    @classmethod
+    def class_name(cls):
+        return "LocalEmbedding"
+
+    def _get_query_embedding(self, query):
+        return embed_texts(self._model, [query])[0].tolist()
+
+    async def _aget_query_embedding(self, query):
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text):
+        return embed_texts(self._model, [text])[0].tolist()
+
+    def _get_text_embeddings(self, texts):
+        return embed_texts(self._model, texts).tolist()
+
+
+_worker_model = None
+
+def _init_worker(model_name, threads):
+    global _worker_model
+    torch.set_num_threads(threads)
+    _worker_model = EmbeddingModelWrapper(model_name, bs=None, device="cpu")
+
+def _embed_batch(texts):
+    return embed_texts(_worker_model, texts)
+
+
+class ParallelEmbedder:
+    """
+    Embeds batches of texts over a pool of worker processes. Each worker holds its own copy
+    of the model (about 420 MB for all-mpnet-base-v2), so on machines with many cores and
+    little memory, use fewer workers with more threads each.
+    """
+
+    def __init__(self, model_name=EmbeddingModelWrapper.DEFAULT_MODEL, workers=None, threads_per_worker=1):
+        self.model_name = model_name
+        self.threads_per_worker = threads_per_worker
+        self.workers = workers or max(1, os.cpu_count() // threads_per_worker)
+        self.pool = None
+
+    def __enter__(self):
+        # Spawn rather than fork, since torch is not fork-safe once it has started threads
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model_name, self.threads_per_worker),
+        )
+        return self
+
+    def __exit__(self, *exc):
+        self.pool.shutdown()
+        self.pool = None
+
+    def embed_batches(self, batches):
+        """
+        Yields one embedding matrix per batch, in input order. Only a window of about two
+        batches per worker is in flight, so memory stays flat however large the corpus is.
+        """
+        window = deque()
+        for batch in batches:
+            window.append(self.pool.submit(_embed_batch, batch))
+            if len(window) >= 2 * self.workers:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
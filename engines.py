@@ -0,0 +1,330 @@
+import os
+import json
+import time
+import random
+import hashlib
+import sqlite3
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from transformers.agents.llm_engine import MessageRole, get_clean_message_list
+from tokens import count_tokens
+from telemetry import telemetry
+
+'''
+LLM engines for the agents. Every OpenAIModel in the process sends its requests through one
+shared AsyncOpenAI client, with a bounded connection pool, on a single event loop thread:
+in-flight requests from many sessions wait on sockets, not on a thread each, and
+connections are reused across agents. Each call has a deadline, and rate limits and server
+errors are retried with jittered exponential backoff within it. Completions are streamed,
+so callers can show partial output (see stream_to), and stop sequences are checked as
+tokens arrive, ending generation as soon as one appears.
+
+CachedEngine wraps any engine with a SQLite cache of its responses, so benchmark runs can
+be recorded once and replayed offline. Each of its calls is timed as an "llm" telemetry
+span, with its prompt and completion tokens and cache hits.
+
+openai (and httpx) are imported on first use, so importing the engines (e.g. to replay
+cached responses, or in tests) doesn't load the client library.
+'''
+
+logger = logging.getLogger(__name__)
+
+openai_role_conversions = {
+    MessageRole.TOOL_RESPONSE: MessageRole.USER,
+}
+
+@lru_cache(maxsize=None)
+def retryable_errors():
+    """Rate limits (429), server errors (5xx), dropped connections and timeouts."""
+    import openai
+    return (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+
+class Backoff:
+    """
+    Jittered exponential backoff: retry n (from 0) waits a random time of up to
+    min(cap, base * 2**n) seconds, or what the server asked for in Retry-After if longer.
+    """
+
+    def __init__(self, retries=4, base=0.5, cap=8.0):
+        self.retries = retries
+        self.base = base
+        self.cap = cap
+
+    def delay(self, attempt, error=None):
+        delay = random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+        response = getattr(error, "response", None)
+        try:
+            retry_after = float(response.headers.get("retry-after"))
+        except (AttributeError, TypeError, ValueError):
+            retry_after = 0.0
+        return max(delay, min(retry_after, self.cap))
+
+
+_listeners = threading.local()
+
+
+@contextmanager
+def stream_to(callback):
+    """
+    Within this block, OpenAIModel calls made by this thread pass their output so far to
+    callback(text) as it streams in. The callback runs on the client's event loop thread,
+    so it must be thread-safe (e.g. queue.Queue.put) and quick.
+    """
+    previous = getattr(_listeners, "callback", None)
+    _listeners.callback = callback
+    try:
+        yield
+    finally:
+        _listeners.callback = previous
+
+
+def find_stop(text, stop_sequences, start=0):
+    """Returns the index of the earliest stop sequence in text at or after start, or None."""
+    found = [i for i in (text.find(stop, start) for stop in stop_sequences) if i >= 0]
+    return min(found) if found else None
+
+
+def partial_stop_length(text, stop_sequences):
+    """Returns the length of the longest end of text that could be the start of a stop sequence."""
+    return max(
+        (k for stop in stop_sequences for k in range(len(stop) - 1, 0, -1) if text.endswith(stop[:k])),
+        default=0,
+    )
+
+
+class SharedClient:
+    """
+    An AsyncOpenAI client running on its own event loop thread. Use SharedClient.get() for
+    the process-wide instance, configured from OPENAI_API_KEY, OPENAI_BASE_URL and
+    OPENAI_MAX_CONNECTIONS.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, api_key=None, base_url=None, max_connections=None):
+        import httpx
+        import openai
+        max_connections = max_connections or int(os.getenv("OPENAI_MAX_CONNECTIONS", 64))
+        self.client = openai.AsyncOpenAI(
+            api_key=api_key or os.getenv("OPENAI_API_KEY"),
+            base_url=base_url or os.getenv("OPENAI_BASE_URL"),
+            # Retries are made by OpenAIModel, within each call's deadline
+            max_retries=0,
+            http_client=openai.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            ),
+        )
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="openai-client", daemon=True).start()
+
+    @classmethod
+    def get(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def submit(self, coroutine):
+        """Schedules a coroutine on the client's loop, and returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def close(self):
+        self.submit(self.client.close()).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class OpenAIModel:
+    """
+    A transformers.agents LLM engine for OpenAI-compatible chat completions. Calling it blocks
+    the caller until the completion arrives; async callers can await acall instead.
+    """
+
+    def __init__(
+        self,
+        model_name="gpt-4o-mini-2024-07-18",
+        temperature=0.5,
+        timeout=None,
+        backoff=None,
+        client=None,
+        stream=None,
+    ):
+        self.model_name = model_name
+        self.temperature = temperature
+        # Seconds for the whole call, retries included
+        self.timeout = timeout or float(os.getenv("OPENAI_TIMEOUT", 60))
+        self.backoff = backoff or Backoff()
+        self._client = client
+        self.stream = stream if stream is not None else os.getenv("OPENAI_STREAM", "1") != "0"
+
+    @property
+    def client(self):
+        # Created on first use, so engines replayed from a cache need no key or network
+        if self._client is None:
+            self._client = SharedClient.get()
+        return self._client
+
+    def __call__(self, messages, stop_sequences=[]):
+        on_text = getattr(_listeners, "callback", None)
+        return self.client.submit(self.complete(messages, stop_sequences, on_text)).result()
+
+    async def acall(self, messages, stop_sequences=[], on_text=None):
+        return await asyncio.wrap_future(self.client.submit(self.complete(messages, stop_sequences, on_text)))
+
+    async def complete(self, messages, stop_sequences=[], on_text=None):
+        """Requests a completion on the client's loop, retrying until the call's deadline."""
+        messages = get_clean_message_list(messages, role_conversions=openai_role_conversions)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        for attempt in range(self.backoff.retries + 1):
+            remaining = max(deadline - loop.time(), 0.001)
+            request = self.stream_completion if self.stream else self.completion
+            try:
+                return await asyncio.wait_for(request(messages, stop_sequences, remaining, on_text), remaining)
+            except retryable_errors() as e:
+                delay = self.backoff.delay(attempt, e)
+                if attempt == self.backoff.retries or loop.time() + delay >= deadline:
+                    raise
+                logger.warning("Retrying the completion in %.2fs after: %s", delay, e)
+                await asyncio.sleep(delay)
+
+    async def completion(self, messages, stop_sequences, timeout, on_text=None):
+        import openai
+        response = await self.client.client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            stop=stop_sequences or openai.NOT_GIVEN,
+            temperature=self.temperature,
+            timeout=timeout,
+        )
+        return response.choices[0].message.content
+
+    async def stream_completion(self, messages, stop_sequences, timeout, on_text=None):
+        import openai
+        stream = await self.client.client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            stop=stop_sequences or openai.NOT_GIVEN,
+            temperature=self.temperature,
+            timeout=timeout,
+            stream=True,
+        )
+        text = ""
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                # A stop sequence may straddle chunks, so look back by the longest one
+                start = max(len(text) - max(map(len, stop_sequences), default=0), 0)
+                text += delta
+                stop = find_stop(text, stop_sequences, start)
+                if stop is not None:
+                    # Servers without stop support would keep generating, so hang up
+                    text = text[:stop]
+                    break
+                if on_text is not None:
+                    # Hold back what may turn out to be the start of a stop sequence
+                    on_text(text[:len(text) - partial_stop_length(text, stop_sequences)])
+        finally:
+            await stream.close()
+        if on_text is not None:
+            on_text(text)
+        return text
+
+
+def cache_key(messages, stop_sequences, model, temperature, **kwargs):
+    """Hashes everything that determines a completion: the cleaned messages, stop sequences, model and temperature."""
+    payload = {
+        "messages": get_clean_message_list(messages),
+        "stop_sequences": list(stop_sequences),
+        "model": model,
+        "temperature": temperature,
+        **kwargs,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResponseCache:
+    """LLM responses by cache_key, in a SQLite database shared by every thread."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, model TEXT, response TEXT, created REAL)"
+        )
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, model, response):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, model, response, time.time())
+            )
+
+
+class CacheMiss(LookupError):
+    pass
+
+
+class CachedEngine:
+    """
+    Wraps an LLM engine (OpenAIModel, HfApiEngine) with a ResponseCache. Modes:
+
+    * "record": serves cached responses, and calls the engine and stores the response on a miss
+    * "replay": only serves cached responses, raising CacheMiss on a miss, so runs need no network
+    * "passthrough": always calls the engine, and leaves the cache untouched
+    """
+
+    MODES = ("record", "replay", "passthrough")
+
+    def __init__(self, engine, mode=None, path=None):
+        self.engine = engine
+        self.mode = mode or os.getenv("SQUAD_LLM_CACHE", "passthrough")
+        if self.mode not in self.MODES:
+            raise ValueError(f"Unknown LLM cache mode {self.mode!r}, expected one of {self.MODES}")
+        path = path or os.getenv("SQUAD_LLM_CACHE_PATH", "data/cache/llm_responses.sqlite")
+        self.cache = ResponseCache(path) if self.mode != "passthrough" else None
+        self.model = getattr(engine, "model_name", None) or getattr(engine, "model", None)
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name):
+        # Only called for attributes CachedEngine lacks, such as the engine's model_name
+        if name == "engine":
+            raise AttributeError(name)
+        return getattr(self.engine, name)
+
+    def __call__(self, messages, stop_sequences=[], **kwargs):
+        with telemetry.span("llm", model=self.model, cache=self.mode) as span:
+            span["prompt_tokens"] = count_tokens("\n".join(str(message["content"]) for message in messages))
+            response = self.cached_call(messages, stop_sequences, span, **kwargs)
+            span["completion_tokens"] = count_tokens(str(response))
+            return response
+
+    def cached_call(self, messages, stop_sequences, span, **kwargs):
+        if self.cache is None:
+            return self.engine(messages, stop_sequences=stop_sequences, **kwargs)
+        key = cache_key(messages, stop_sequences, self.model, getattr(self.engine, "temperature", None), **kwargs)
+        response = self.cache.get(key)
+        if response is not None:
+            self.hits += 1
+            span["cache_hits"] = 1
+            return response
+        self.misses += 1
+        span["cache_misses"] = 1
+        if self.mode == "replay":
+            raise CacheMiss(f"No recorded response for this prompt ({key[:12]}) in replay mode")
+        response = self.engine(messages, stop_sequences=stop_sequences, **kwargs)
+        self.cache.put(key, self.model, response)
+        return response
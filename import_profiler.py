@@ -0,0 +1,73 @@
+import re
+import sys
+import time
+import argparse
+import subprocess
+
+'''
+Startup benchmark: how long importing each of the project's entry points takes, in a fresh
+interpreter, and which modules that time goes to (from python -X importtime). Heavy
+dependencies should only show up under the modules whose code paths use them:
+
+    python import_profiler.py agent data tools.squad_tools --top 15
+'''
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def parse_importtime(stderr):
+    """Returns [(module, self seconds, cumulative seconds, depth)] from -X importtime output."""
+    modules = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            modules.append((name, int(own) / 1e6, int(cumulative) / 1e6, (len(indent) - 1) // 2))
+    return modules
+
+
+def profile_import(module, python=sys.executable):
+    """Imports module in a fresh interpreter, returning (wall seconds, parsed importtime lines)."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        error = "\n".join(line for line in result.stderr.splitlines() if not IMPORTTIME_LINE.match(line))
+        raise RuntimeError(f"Importing {module} failed:\n{error[-2000:]}")
+    return elapsed, parse_importtime(result.stderr)
+
+
+def top_level_costs(modules):
+    """Cumulative seconds per top-level package (e.g. transformers, pandas), costliest first."""
+    costs = {}
+    for name, _, cumulative, depth in modules:
+        package = name.split(".")[0]
+        # A package's own entry covers its submodules, so only count the outermost import
+        if depth == 0 or name == package:
+            costs[package] = max(costs.get(package, 0.0), cumulative)
+    return sorted(costs.items(), key=lambda item: item[1], reverse=True)
+
+
+def print_report(module, elapsed, modules, top=10):
+    print(f"{module}: {elapsed:.2f}s to start and import, {len(modules)} modules")
+    for package, seconds in top_level_costs(modules)[:top]:
+        print(f"  {seconds:7.3f}s  {package}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the import cost of the project's modules")
+    parser.add_argument("modules", nargs="*", default=["agent", "data", "tools.squad_tools", "engines", "prompts"])
+    parser.add_argument("--top", type=int, default=10, help="Top-level packages to list per module")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        try:
+            elapsed, modules = profile_import(module)
+        except RuntimeError as e:
+            print(e)
+            continue
+        print_report(module, elapsed, modules, args.top)
@@ -0,0 +1,224 @@
+import os
+import logging
+import json
+import time
+import hashlib
+import argparse
+
+'''
+The IndexBuilder class keeps a Chroma collection in sync with a list of documents.
+Every document is stored under an id derived from a hash of its content, so a build
+that dies halfway can be resumed, and a rebuild only embeds documents that were
+added or changed. Documents that are no longer in the corpus are deleted.
+
+chromadb and llama-index are only imported once a builder is created, so reading the
+manifest (as the app does on every start) doesn't load them.
+'''
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "index_manifest.json"
+
+
+def read_manifest(path):
+    """Reads the build manifest of the Chroma directory at path, without opening Chroma."""
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+
+def document_id(document):
+    """Returns a stable content hash for a document, used as its id in the collection."""
+    digest = hashlib.sha256(document.text.encode("utf-8"))
+    if document.metadata:
+        digest.update(json.dumps(document.metadata, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def corpus_hash(ids):
+    """Returns a hash identifying a whole corpus, independent of document order."""
+    digest = hashlib.sha256()
+    for id_ in sorted(ids):
+        digest.update(id_.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class IndexBuilder:
+    def __init__(self, path="./chroma_db", collection_name="simple_index", embed_model=None, batch_size=256,
+                 embedder=None, write_batch_size=None):
+        import chromadb
+        from llama_index.vector_stores.chroma import ChromaVectorStore
+        self.path = path
+        self.collection_name = collection_name
+        self.client = chromadb.PersistentClient(path=path)
+        self.collection = self.client.get_or_create_collection(collection_name)
+        self.vector_store = ChromaVectorStore(chroma_collection=self.collection)
+        self.embed_model = embed_model
+        self.batch_size = batch_size
+        # Optional object with an embed_batches(batches) method, e.g. embeddings.ParallelEmbedder
+        self.embedder = embedder
+        # Every write is a checkpoint, so keep it to a few batches
+        self.write_batch_size = write_batch_size or 4 * batch_size
+
+    def read_manifest(self):
+        return read_manifest(self.path)
+
+    def write_manifest(self, **entry):
+        manifest = self.read_manifest()
+        manifest[self.collection_name] = entry
+        manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def needs_build(self, source=None, version=None):
+        """
+        Returns True if the collection was left half built, or was built from a different
+        source (e.g. the raw data file's size and mtime) or document format version.
+        """
+        entry = self.read_manifest().get(self.collection_name)
+        if entry is None:
+            # A collection without a manifest was built elsewhere (e.g. downloaded), so only
+            # build it if it is empty.
+            return self.collection.count() == 0
+        if entry.get("status") != "complete":
+            return True
+        return entry.get("source") != source or entry.get("version") != version
+
+    def existing_ids(self, page_size=10000):
+        ids = set()
+        offset = 0
+        while True:
+            page = self.collection.get(include=[], limit=page_size, offset=offset)["ids"]
+            ids.update(page)
+            if len(page) < page_size:
+                return ids
+            offset += page_size
+
+    def to_nodes(self, ids, documents):
+        from llama_index.core.schema import TextNode
+        return [
+            TextNode(
+                id_=id_,
+                text=document.text,
+                metadata=document.metadata,
+                excluded_embed_metadata_keys=document.excluded_embed_metadata_keys,
+                excluded_llm_metadata_keys=document.excluded_llm_metadata_keys,
+            )
+            for id_, document in zip(ids, documents)
+        ]
+
+    def embed_batches(self, batches):
+        """Yields the embeddings of each batch of nodes, in order."""
+        from llama_index.core import Settings
+        from llama_index.core.schema import MetadataMode
+        texts = (
+            [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+            for nodes in batches
+        )
+        if self.embedder is not None:
+            yield from self.embedder.embed_batches(texts)
+            return
+        embed_model = self.embed_model or Settings.embed_model
+        for batch in texts:
+            yield embed_model.get_text_embedding_batch(batch)
+
+    def upsert(self, nodes, embeddings):
+        for node, embedding in zip(nodes, embeddings):
+            node.embedding = list(embedding)
+        self.vector_store.add(nodes)
+
+    def build(self, documents, source=None, version=None, delete_stale=True):
+        """
+        Embeds and upserts every document that is not yet in the collection, in batches.
+        Each bulk write is persisted by Chroma as soon as it is made, so an interrupted
+        build picks up where it left off.
+        """
+        by_id = {}
+        for document in documents:
+            by_id.setdefault(document_id(document), document)
+        target_hash = corpus_hash(by_id)
+
+        entry = self.read_manifest().get(self.collection_name, {})
+        if entry.get("status") == "complete" and entry.get("corpus_hash") == target_hash:
+            # Same documents as the last complete build, e.g. the source was only touched
+            self.write_manifest(status="complete", source=source, version=version,
+                                corpus_hash=target_hash, count=len(by_id))
+            logger.info("Index %s is up to date", self.collection_name)
+            return 0, 0
+
+        existing = self.existing_ids()
+        pending = [id_ for id_ in by_id if id_ not in existing]
+        stale = [id_ for id_ in existing if id_ not in by_id]
+        logger.info("Index %s: %d documents, %d stored, %d to embed, %d stale",
+                    self.collection_name, len(by_id), len(existing), len(pending), len(stale))
+
+        self.write_manifest(status="building", source=source, version=version,
+                            corpus_hash=target_hash, count=len(by_id))
+
+        batches = [
+            self.to_nodes(pending[start:start + self.batch_size],
+                          [by_id[id_] for id_ in pending[start:start + self.batch_size]])
+            for start in range(0, len(pending), self.batch_size)
+        ]
+        started = time.perf_counter()
+        done = 0
+        buffer_nodes, buffer_embeddings = [], []
+        for nodes, embeddings in zip(batches, self.embed_batches(batches)):
+            buffer_nodes.extend(nodes)
+            buffer_embeddings.extend(embeddings)
+            if len(buffer_nodes) >= self.write_batch_size or done + len(buffer_nodes) == len(pending):
+                # Write in bulk; every write is a checkpoint the next build resumes from
+                self.upsert(buffer_nodes, buffer_embeddings)
+                done += len(buffer_nodes)
+                buffer_nodes, buffer_embeddings = [], []
+                elapsed = time.perf_counter() - started
+                logger.info("Embedded %d/%d documents (%.1f docs/sec)", done, len(pending), done / elapsed)
+
+        if delete_stale:
+            for start in range(0, len(stale), self.batch_size):
+                self.collection.delete(ids=stale[start:start + self.batch_size])
+
+        self.write_manifest(status="complete", source=source, version=version,
+                            corpus_hash=target_hash, count=len(by_id))
+        logger.info("Index %s is up to date", self.collection_name)
+        return len(pending), len(stale)
+
+
+if __name__ == "__main__":
+    # Bring the index in sync with the raw data, e.g. after a crash or a corpus change.
+    # With --local, build offline with a local sentence-transformers model on every CPU core.
+    parser = argparse.ArgumentParser(description="Build or update the SQuAD Chroma index")
+    parser.add_argument("--local", action="store_true", help="Embed with a local sentence-transformers model")
+    parser.add_argument("--embed-model", default=None, help="Local model name (defaults to semscore's model)")
+    parser.add_argument("--workers", type=int, default=None, help="Embedding worker processes (defaults to one per core)")
+    parser.add_argument("--threads-per-worker", type=int, default=1,
+                        help="Torch threads per worker; raise it and lower --workers to save memory")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--write-batch-size", type=int, default=None,
+                        help="Documents per Chroma write, i.e. per checkpoint (defaults to 4 batches)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    from data import load_squad_qas, paragraph_documents, configure_embed_model, source_stamp, \
+        DOCUMENT_VERSION, CHROMA_PATH, collection_name
+    from semscore import EmbeddingModelWrapper
+    documents = paragraph_documents(load_squad_qas())
+    source = source_stamp()
+
+    if args.local:
+        from embeddings import ParallelEmbedder
+        model_name = args.embed_model or EmbeddingModelWrapper.DEFAULT_MODEL
+        with ParallelEmbedder(model_name, workers=args.workers,
+                              threads_per_worker=args.threads_per_worker) as embedder:
+            logger.info("Embedding with %s on %d workers", model_name, embedder.workers)
+            IndexBuilder(path=CHROMA_PATH, collection_name=collection_name(model_name),
+                         batch_size=args.batch_size, write_batch_size=args.write_batch_size,
+                         embedder=embedder).build(documents, source=source, version=DOCUMENT_VERSION)
+    else:
+        configure_embed_model()
+        IndexBuilder(path=CHROMA_PATH, collection_name=collection_name(),
+                     batch_size=args.batch_size, write_batch_size=args.write_batch_size,
+                     ).build(documents, source=source, version=DOCUMENT_VERSION)
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import argparse
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+Load generator for the Gradio app. Each simulated session is its own Gradio client (so its
+own session hash), and sends its questions one after another through the same endpoints as
+the chat box: add_message, then interact_with_agent. Run the app against the mock LLM
+server to measure the app itself rather than OpenAI:
+
+    python mock_llm_server.py --latency 0.5 &
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=mock python app.py &
+    python load_test.py --sessions 16 --questions 4
+'''
+
+DEFAULT_QUESTIONS = [
+    "What is on top of the Notre Dame building?",
+    "What is in front of the Notre Dame Main Building?",
+    "What is Beyoncé's profession?",
+    "When did Beyoncé start becoming popular?",
+]
+
+
+def load_questions(path=os.path.join("samples", "samples.pkl")):
+    """The synthesized benchmark questions, or a few built-in ones without the samples."""
+    try:
+        import pandas as pd
+        return pd.read_pickle(path)["Synthesized Question"].tolist()
+    except (ImportError, OSError, KeyError):
+        return DEFAULT_QUESTIONS
+
+
+def percentiles(values, ps=(50, 95, 99)):
+    if not values:
+        return {f"p{p}": None for p in ps}
+    return {f"p{p}": float(np.percentile(values, p)) for p in ps}
+
+
+class Session:
+    """One simulated user, chatting with the app through its own Gradio client."""
+
+    def __init__(self, url, add_message_api="/add_message", interact_api="/interact_with_agent"):
+        from gradio_client import Client
+        self.client = Client(url, verbose=False)
+        self.add_message_api = add_message_api
+        self.interact_api = interact_api
+        self.history = []
+
+    def ask(self, question):
+        """Sends a question, and returns (seconds to the first update, seconds to the last)."""
+        start = time.perf_counter()
+        self.history = self.client.predict(question, self.history, api_name=self.add_message_api)
+        job = self.client.submit(self.history, api_name=self.interact_api)
+        first_update = None
+        for _ in job:
+            if first_update is None:
+                first_update = time.perf_counter() - start
+        outputs = job.outputs()
+        if outputs:
+            self.history = outputs[-1][0]
+        total = time.perf_counter() - start
+        return first_update if first_update is not None else total, total
+
+
+def run_load_test(url, sessions=8, questions_per_session=4, questions=None, **session_kwargs):
+    """Runs sessions concurrently, and returns throughput and latency percentiles."""
+    questions = questions or load_questions()
+    first_updates, latencies, errors = [], [], []
+    lock = threading.Lock()
+
+    def run_session(n):
+        session = Session(url, **session_kwargs)
+        for i in range(questions_per_session):
+            question = questions[(n * questions_per_session + i) % len(questions)]
+            try:
+                first_update, latency = session.ask(question)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+                continue
+            with lock:
+                first_updates.append(first_update)
+                latencies.append(latency)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        list(pool.map(run_session, range(sessions)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "sessions": sessions,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency": percentiles(latencies),
+        "first_update": percentiles(first_updates),
+    }
+
+
+def print_report(report):
+    print(f"{report['sessions']} sessions, {report['requests']} requests, {report['errors']} errors "
+          f"in {report['seconds']:.1f}s: {report['throughput_rps']:.2f} requests/s")
+    for name in ("latency", "first_update"):
+        values = ", ".join(f"{p} {v:.2f}s" if v is not None else f"{p} -" for p, v in report[name].items())
+        print(f"{name.replace('_', ' ').capitalize()}: {values}")
+    for error in report["error_samples"]:
+        print(f"  {error}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive the Gradio app with concurrent chat sessions")
+    parser.add_argument("--url", default="http://127.0.0.1:7860/")
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent sessions")
+    parser.add_argument("--questions", type=int, default=4, help="Questions asked by each session, in turn")
+    parser.add_argument("--add-message-api", default="/add_message")
+    parser.add_argument("--interact-api", default="/interact_with_agent")
+    parser.add_argument("--json", default=None, help="Also write the report to this file")
+    args = parser.parse_args()
+
+    report = run_load_test(
+        args.url,
+        sessions=args.sessions,
+        questions_per_session=args.questions,
+        add_message_api=args.add_message_api,
+        interact_api=args.interact_api,
+    )
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,149 @@
+import re
+import json
+import time
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+'''
+A deterministic OpenAI-compatible chat completions server, standing in for the LLM in load
+tests. It answers like a well-behaved SQuAD agent: the first step of a task calls
+squad_retriever with the task, and the next calls final_answer with the first acceptable
+answer in the observation. Latency is configurable, so the app can be loaded with many
+sessions without sending anything to OpenAI:
+
+    python mock_llm_server.py --port 8001 --latency 0.5
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=mock python app.py
+'''
+
+TASK_MARKERS = ("New task:\n", "Task: ")
+MESSAGE_SEPARATOR = "\n=======\n"
+ANSWER_PATTERN = re.compile(r"Acceptable Answers:\n\['1\. (.*?)'")
+MAX_ERRORS = 2
+
+
+def current_task(messages):
+    """Returns the latest task in the conversation, and the text that follows it."""
+    contents = [str(message.get("content", "")) for message in messages if message.get("role") != "system"]
+    for i in range(len(contents) - 1, -1, -1):
+        start, marker = max((contents[i].rfind(marker), marker) for marker in TASK_MARKERS)
+        if start >= 0:
+            # Observations that follow the task may have been merged into its message
+            task, _, after = contents[i][start + len(marker):].partition(MESSAGE_SEPARATOR)
+            return task.strip(), "\n".join([after] + contents[i + 1:])
+    return (contents[-1].strip() if contents else ""), ""
+
+
+def scripted_completion(messages):
+    """The completion for a conversation: retrieve first, then answer from the observation."""
+    task, after = current_task(messages)
+    if "-> Observation:" not in after and after.count("-> Error:") < MAX_ERRORS:
+        return (
+            "Thought: I will use the squad_retriever tool to find this in SQuAD.\n"
+            "Code:\n```py\n"
+            f"print(squad_retriever(query={task!r}))\n"
+            "```<end_action>"
+        )
+    match = ANSWER_PATTERN.search(after)
+    answer = match.group(1) if match else "I could not find the answer in SQuAD."
+    return (
+        "Thought: The retrieved documents answer the question.\n"
+        "Code:\n```py\n"
+        f"final_answer({answer!r})\n"
+        "```<end_action>"
+    )
+
+
+def apply_stop(text, stop):
+    if isinstance(stop, str):
+        stop = [stop]
+    cuts = [i for i in (text.find(s) for s in stop or []) if i >= 0]
+    return text[:min(cuts)] if cuts else text
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            return self.send_json({"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+        self.send_json({"error": {"message": f"Unknown path {self.path}"}}, status=404)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self.send_json({"error": {"message": f"Unknown path {self.path}"}}, status=404)
+        content = apply_stop(scripted_completion(request.get("messages", [])), request.get("stop"))
+        self.server.completions += 1
+        time.sleep(self.server.latency)
+        if request.get("stream"):
+            return self.stream(content, request.get("model", "mock"))
+        self.send_json({
+            "id": f"mock-{self.server.completions}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    def send_json(self, body, status=200):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def stream(self, content, model):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        size = self.server.chunk_size
+        try:
+            for start in range(0, len(content), size):
+                self.send_event({
+                    "id": f"mock-{self.server.completions}",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": content[start:start + size]}, "finish_reason": None}],
+                })
+                time.sleep(self.server.chunk_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client hung up, e.g. after seeing a stop sequence
+            pass
+
+    def send_event(self, body):
+        self.wfile.write(f"data: {json.dumps(body)}\n\n".encode())
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+def make_server(host="127.0.0.1", port=8001, latency=0.5, chunk_size=4, chunk_delay=0.01):
+    """Creates (without starting) a mock server; latency is the delay before each completion's first token."""
+    server = ThreadingHTTPServer((host, port), MockLLMHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.chunk_size = chunk_size
+    server.chunk_delay = chunk_delay
+    server.completions = 0
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve scripted SQuAD agent completions over the OpenAI API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before each completion's first token")
+    parser.add_argument("--chunk-size", type=int, default=4, help="Characters per streamed chunk")
+    parser.add_argument("--chunk-delay", type=float, default=0.01, help="Seconds between streamed chunks")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.chunk_size, args.chunk_delay)
+    print(f"Mock LLM serving on http://{args.host}:{server.server_port}/v1")
+    server.serve_forever()
@@ -0,0 +1,169 @@
+import os
+import hashlib
+import argparse
+from transformers.agents.llm_engine import MessageRole
+from tokens import count_tokens
+
+'''
+Profiling of what the agent's prompts cost. Each LLM call is broken down, in tokens, into
+the system prompt (without its tool descriptions), the tool descriptions, the history
+(tasks and the agent's own outputs) and the observations (tool outputs and errors). Calls
+also record a hash of their system prompt, so a run shows whether the static prefix stayed
+byte-identical (one prefix) and could hit the provider's prompt cache.
+
+Prompt variants are compared on tokens per answered question:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=mock python prompt_profiler.py --questions 20
+
+or offline, against responses recorded with SQUAD_LLM_CACHE=record, with --llm-cache replay.
+'''
+
+PARTS = ("system", "tools", "history", "observations", "completion")
+
+
+def prefix_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()[:12]
+
+
+def prompt_breakdown(messages, tool_descriptions=""):
+    """Tokens per part of a prompt, as the agent passes it to its engine (before role conversion)."""
+    parts = dict.fromkeys(PARTS, 0)
+    prefix = None
+    for message in messages:
+        content = str(message["content"])
+        tokens = count_tokens(content)
+        if message["role"] == MessageRole.SYSTEM:
+            tools = count_tokens(tool_descriptions) if tool_descriptions and tool_descriptions in content else 0
+            parts["tools"] += tools
+            parts["system"] += tokens - tools
+            prefix = prefix or prefix_hash(content)
+        elif message["role"] == MessageRole.TOOL_RESPONSE:
+            parts["observations"] += tokens
+        else:
+            parts["history"] += tokens
+    parts["prompt"] = sum(parts[part] for part in ("system", "tools", "history", "observations"))
+    parts["prefix"] = prefix
+    return parts
+
+
+class ProfiledEngine:
+    """Wraps an agent's engine, recording the breakdown of every call to the profiler."""
+
+    def __init__(self, engine, profiler, tool_descriptions=""):
+        self.engine = engine
+        self.profiler = profiler
+        self.tool_descriptions = tool_descriptions
+
+    def __getattr__(self, name):
+        if name == "engine":
+            raise AttributeError(name)
+        return getattr(self.engine, name)
+
+    def __call__(self, messages, stop_sequences=[], **kwargs):
+        call = prompt_breakdown(messages, self.tool_descriptions)
+        response = self.engine(messages, stop_sequences=stop_sequences, **kwargs)
+        call["completion"] = count_tokens(str(response))
+        self.profiler.calls.append(call)
+        return response
+
+
+class PromptProfiler:
+    """
+    Collects the prompt breakdown of every LLM call made by the agents it is attached to,
+    and the number of questions they answered, for summary().
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.questions = 0
+        self.answered = 0
+
+    def attach(self, agent):
+        tool_descriptions = agent.toolbox.show_tool_descriptions(agent.tool_description_template)
+        agent.llm_engine = ProfiledEngine(agent.llm_engine, self, tool_descriptions)
+        return agent
+
+    def run(self, agent, question, **kwargs):
+        """Runs the agent on a question, counting it as answered if the agent called final_answer."""
+        self.questions += 1
+        try:
+            answer = agent.run(question, **kwargs)
+        except Exception as e:
+            print(f"Agent failed on {question!r}: {e}")
+            return None
+        if any("final_answer" in step for step in agent.logs):
+            self.answered += 1
+        return answer
+
+    def summary(self):
+        calls = len(self.calls)
+        totals = {part: sum(call[part] for call in self.calls) for part in PARTS + ("prompt",)}
+        return {
+            "calls": calls,
+            "questions": self.questions,
+            "answered": self.answered,
+            "prefixes": len({call["prefix"] for call in self.calls}),
+            **{f"mean_{part}": totals[part] / calls if calls else 0.0 for part in PARTS + ("prompt",)},
+            "total_tokens": totals["prompt"] + totals["completion"],
+            "tokens_per_answer": (totals["prompt"] + totals["completion"]) / self.answered if self.answered else None,
+        }
+
+
+def compare_prompts(prompts, questions, make_agent):
+    """Profiles each named system prompt on the questions, with agents from make_agent(system_prompt)."""
+    results = {}
+    for name, system_prompt in prompts.items():
+        profiler = PromptProfiler()
+        agent = profiler.attach(make_agent(system_prompt))
+        for question in questions:
+            profiler.run(agent, question, reset=True)
+        results[name] = profiler.summary()
+    return results
+
+
+def static_size(agent):
+    """Tokens of the system prompt the agent sends on every call, split into prompt and tools."""
+    agent.task = ""
+    agent.initialize_for_run()
+    breakdown = prompt_breakdown(
+        [{"role": MessageRole.SYSTEM, "content": agent.system_prompt}],
+        agent.toolbox.show_tool_descriptions(agent.tool_description_template),
+    )
+    return {"system": breakdown["system"], "tools": breakdown["tools"], "prefix": breakdown["prefix"]}
+
+
+def print_report(sizes, results):
+    for name, size in sizes.items():
+        line = f"{name}: static {size['system']} + {size['tools']} tool tokens (prefix {size['prefix']})"
+        result = results.get(name)
+        if result:
+            per_answer = f"{result['tokens_per_answer']:.0f}" if result["tokens_per_answer"] is not None else "-"
+            line += (
+                f", {result['answered']}/{result['questions']} answered in {result['calls']} calls, "
+                f"per call: history {result['mean_history']:.0f}, observations {result['mean_observations']:.0f}, "
+                f"completion {result['mean_completion']:.0f}; {per_answer} tokens per answer, "
+                f"{result['prefixes']} distinct prefix(es)"
+            )
+        print(line)
+
+
+if __name__ == "__main__":
+    from agent import get_agent
+    from prompts import PROMPTS
+    from load_test import load_questions
+
+    parser = argparse.ArgumentParser(description="Compare the system prompts on prompt tokens per answered question")
+    parser.add_argument("--prompts", nargs="*", default=None, help="Names from prompts.PROMPTS (all SQuAD prompts by default)")
+    parser.add_argument("--questions", type=int, default=0, help="Sample questions to run each prompt on (0: static sizes only)")
+    parser.add_argument("--llm-cache", default=None, help="record, replay or passthrough (default: SQUAD_LLM_CACHE)")
+    args = parser.parse_args()
+
+    names = args.prompts or [name for name in PROMPTS if "SQUAD" in name]
+    prompts = {name: PROMPTS[name] for name in names}
+
+    def make_agent(system_prompt):
+        return get_agent(system_prompt=system_prompt, llm_cache_mode=args.llm_cache)
+
+    sizes = {name: static_size(make_agent(prompt)) for name, prompt in prompts.items()}
+    results = compare_prompts(prompts, load_questions()[:args.questions], make_agent) if args.questions else {}
+    print_report(sizes, results)
@@ -1,28 +1,71 @@
-# Import all prompts as both constants and in a PROMPTS dictionary,
-# from all files in the prompts directory that aren't __init__.py 
+# All prompts, as both constants and in a PROMPTS dictionary, from all files in the prompts
+# directory that aren't __init__.py. The files are found next to this one, whatever the
+# working directory, and their constants are read from their source: a prompt module is
+# only imported when one of its prompts is first used.
 
 import os
+import ast
+import importlib
+from collections.abc import Mapping
+from typing import TYPE_CHECKING
 
-def load_constants(constants_dir):
-    """Loads constants from .py files in the specified directory."""
+PROMPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def find_constants(constants_dir=PROMPTS_DIR):
+    """Maps each constant assigned in the .py files of the directory to its module name."""
 
     constants = {}
 
-    for filename in os.listdir(constants_dir):
+    for filename in sorted(os.listdir(constants_dir)):
         if filename.endswith(".py") and filename != "__init__.py":
             module_name = filename[:-3]  # Remove .py extension
-            module = __import__(f"{constants_dir}.{module_name}", fromlist=[module_name])
+            with open(os.path.join(constants_dir, filename), "r", encoding="utf-8") as f:
+                tree = ast.parse(f.read(), filename)
 
-            for name, value in vars(module).items():
-                if name.isupper():  # Convention for constants
-                    constants[name] = value
+            for node in tree.body:
+                targets = node.targets if isinstance(node, ast.Assign) else [getattr(node, "target", None)]
+                for target in targets:
+                    if isinstance(target, ast.Name) and target.id.isupper():  # Convention for constants
+                        constants[target.id] = module_name
 
     return constants
 
-PROMPTS = load_constants("prompts")
+
+class LazyPrompts(Mapping):
+    """Prompts by constant name, importing each prompt module on first access."""
+
+    def __init__(self, constants):
+        self.constants = constants
+
+    def __getitem__(self, name):
+        module = importlib.import_module(f"{__name__}.{self.constants[name]}")
+        return getattr(module, name)
+
+    def __iter__(self):
+        return iter(self.constants)
+
+    def __len__(self):
+        return len(self.constants)
+
+
+PROMPTS = LazyPrompts(find_constants())
+
+__all__ = ["PROMPTS", "DEFAULT_REACT_CODE_SYSTEM_PROMPT", *PROMPTS]
+
+
+def __getattr__(name):
+    if name in PROMPTS:
+        return PROMPTS[name]
+    if name == "DEFAULT_REACT_CODE_SYSTEM_PROMPT":
+        from transformers.agents.prompts import DEFAULT_REACT_CODE_SYSTEM_PROMPT
+        return DEFAULT_REACT_CODE_SYSTEM_PROMPT
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # Import all prompts locally as well, for code completion
-from transformers.agents.prompts import DEFAULT_REACT_CODE_SYSTEM_PROMPT
-from prompts.default import DEFAULT_SQUAD_REACT_CODE_SYSTEM_PROMPT
-from prompts.succinct import SUCCINCT_SQUAD_REACT_CODE_SYSTEM_PROMPT
-from prompts.focused import FOCUSED_SQUAD_REACT_CODE_SYSTEM_PROMPT
\ No newline at end of file
+if TYPE_CHECKING:
+    from transformers.agents.prompts import DEFAULT_REACT_CODE_SYSTEM_PROMPT
+    from prompts.default import DEFAULT_SQUAD_REACT_CODE_SYSTEM_PROMPT
+    from prompts.succinct import SUCCINCT_SQUAD_REACT_CODE_SYSTEM_PROMPT
+    from prompts.focused import FOCUSED_SQUAD_REACT_CODE_SYSTEM_PROMPT
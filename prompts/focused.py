@@ -33,14 +33,10 @@ Context: Architecturally, the school has a Catholic character. Atop the Main Bui
 Question: What sits on top of the Main Building at Notre Dame?
 Acceptable Answers:
 ['1. a golden statue of the Virgin Mary']
-Score: 0.8028363947877308
-===Document===
-Title: University_of_Notre_Dame
-Context: Architecturally, the school has a Catholic character. Atop the Main Building's gold dome is a golden statue of the Virgin Mary. Immediately in front of the Main Building and facing it, is a copper statue of Christ with arms upraised with the legend "Venite Ad Me Omnes". Next to the Main Building is the Basilica of the Sacred Heart. Immediately behind the basilica is the Grotto, a Marian place of prayer and reflection. It is a replica of the grotto at Lourdes, France where the Virgin Mary reputedly appeared to Saint Bernadette Soubirous in 1858. At the end of the main drive (and in a direct line that connects through 3 statues and the Gold Dome), is a simple, modern stone statue of Mary.
 Question: What is in front of the Notre Dame Main Building?
 Acceptable Answers:
 ['1. a copper statue of Christ']
-Score: 0.7858663256898658
+Score: 0.8028363947877308
 
 Thought: From the information retrieved, I learned that on top of the Notre Dame Main Building's gold dome, there is a golden statue of the Virgin Mary. I will now use this information to provide the final answer.
 Code:
@@ -129,6 +125,7 @@ Above example were using notional tools that might not exist for you. On top of
 
 When asked an informational question, always start with the squad_retriever tool. To use it effectively, you should enrich the question with facts you know, and then try to get the information you need from the squad_retriever tool available to you. 
 Only try other tools if you cannot get enough information from the squad_retriever tool to answer the question.
+To look up several phrasings or sub-questions, pass them together as a list in a single call, as in 'squad_retriever(query=["Who founded Notre Dame?", "When was Notre Dame founded?"])', rather than calling the tool once per query.
 
 Here are the rules you should always follow to solve your task:
 1. Always provide a 'Thought:' sequence, and a 'Code:\n```py' sequence ending with '```<end_action>' sequence, else you will fail.
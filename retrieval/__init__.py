@@ -0,0 +1,15 @@
+# In-process retrieval backends for the squad_retriever tool, as alternatives to querying
+# the Chroma collection through llama-index.
+
+from retrieval.flat import FlatIndex, SearchResult, top_k, normalize
+from retrieval.ivf import IVFIndex, kmeans
+from retrieval.bm25 import BM25Index, tokenize
+from retrieval.fusion import reciprocal_rank_fusion
+from retrieval.retriever import VectorRetriever, embed_query, embed_queries
+from retrieval.cache import LRUCache, SemanticCache, normalize_query
+
+# Vector index backends, by the name used in SQUAD_RETRIEVER_BACKEND
+VECTOR_INDEXES = {
+    "flat": FlatIndex,
+    "ivf": IVFIndex,
+}
@@ -0,0 +1,139 @@
+import os
+import logging
+import re
+import json
+import numpy as np
+from collections import Counter
+from retrieval.flat import SearchResult, documents_frame, read_collection, title_rows, top_k
+
+'''
+BM25 keyword search over the same documents as the vector index. Many SQuAD questions hinge
+on exact entities (names, years, places), which a keyword match finds faster and more
+reliably than a dense search. Postings are stored as flat arrays (CSR layout) rather than
+a dict of lists, so the index is compact, loads with a few np.load calls, and a query is
+scored with one np.bincount.
+'''
+
+logger = logging.getLogger(__name__)
+
+TERMS_FILE = "terms.json"
+POSTINGS_FILE = "postings.npz"
+DOCUMENTS_FILE = "documents.parquet"
+INFO_FILE = "info.json"
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "did", "do", "does", "for", "from", "how",
+    "in", "is", "it", "of", "on", "or", "s", "that", "the", "to", "was", "were", "what", "when",
+    "where", "which", "who", "whom", "why", "with",
+}
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def searchable_text(text, metadata):
+    """The title and context, plus the questions linked to the paragraph."""
+    questions = [qa["question"] for qa in json.loads(metadata.get("qas", "[]"))]
+    return "\n".join([str(metadata.get("title", "")), text] + questions)
+
+
+class BM25Index:
+    def __init__(self, path, k1=1.5, b=0.75):
+        import pandas as pd
+        self.path = path
+        with open(os.path.join(path, TERMS_FILE), "r") as f:
+            self.term_ids = {term: i for i, term in enumerate(json.load(f))}
+        postings = np.load(os.path.join(path, POSTINGS_FILE))
+        self.offsets = postings["offsets"]
+        self.doc_ids = postings["doc_ids"]
+        self.tfs = postings["tfs"]
+        self.doc_lengths = postings["doc_lengths"]
+        documents = pd.read_parquet(os.path.join(path, DOCUMENTS_FILE))
+        self.ids = documents["id"].tolist()
+        self.texts = documents["text"].tolist()
+        self.metadatas = documents["metadata"].tolist()
+        self.titles = documents["title"].to_numpy(dtype=str)
+        with open(os.path.join(path, INFO_FILE), "r") as f:
+            self.info = json.load(f)
+        self.k1 = k1
+        self.b = b
+        document_frequencies = np.diff(self.offsets)
+        n = len(self.ids)
+        self.idf = np.log1p((n - document_frequencies + 0.5) / (document_frequencies + 0.5)).astype(np.float32)
+        self.length_norm = (k1 * (1 - b + b * self.doc_lengths / max(self.doc_lengths.mean(), 1))).astype(np.float32)
+
+    @staticmethod
+    def exists(path):
+        return all(
+            os.path.exists(os.path.join(path, f))
+            for f in (TERMS_FILE, POSTINGS_FILE, DOCUMENTS_FILE, INFO_FILE)
+        )
+
+    @classmethod
+    def write(cls, path, ids, texts, metadatas, **info):
+        terms = {}
+        term_column, doc_column, tf_column = [], [], []
+        doc_lengths = np.zeros(len(ids), dtype=np.float32)
+        for doc_id, (text, metadata) in enumerate(zip(texts, metadatas)):
+            tokens = tokenize(searchable_text(text, metadata))
+            doc_lengths[doc_id] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_column.append(terms.setdefault(term, len(terms)))
+                doc_column.append(doc_id)
+                tf_column.append(tf)
+
+        term_column = np.asarray(term_column, dtype=np.int32)
+        order = np.argsort(term_column, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(term_column, minlength=len(terms)))])
+
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, TERMS_FILE), "w") as f:
+            json.dump(list(terms), f, ensure_ascii=False)
+        np.savez(
+            os.path.join(path, POSTINGS_FILE),
+            offsets=offsets.astype(np.int64),
+            doc_ids=np.asarray(doc_column, dtype=np.int32)[order],
+            tfs=np.asarray(tf_column, dtype=np.float32)[order],
+            doc_lengths=doc_lengths,
+        )
+        documents_frame(ids, texts, metadatas).to_parquet(os.path.join(path, DOCUMENTS_FILE), index=False)
+        with open(os.path.join(path, INFO_FILE), "w") as f:
+            json.dump(info, f, indent=2)
+
+    @classmethod
+    def from_collection(cls, collection, path, **info):
+        """Indexes the documents of a Chroma collection, and opens the index."""
+        logger.info("Building keyword index of %s in %s...", collection.name, path)
+        ids, texts, metadatas, _ = read_collection(collection)
+        cls.write(path, ids, texts, metadatas, **info)
+        return cls(path)
+
+    @property
+    def corpus_hash(self):
+        return self.info.get("corpus_hash")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, query):
+        term_ids = [self.term_ids[t] for t in set(tokenize(query)) if t in self.term_ids]
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        if not term_ids:
+            return scores
+        postings = [slice(self.offsets[t], self.offsets[t + 1]) for t in term_ids]
+        doc_ids = np.concatenate([self.doc_ids[p] for p in postings])
+        tfs = np.concatenate([self.tfs[p] for p in postings])
+        idf = np.concatenate([np.full(p.stop - p.start, self.idf[t]) for p, t in zip(postings, term_ids)])
+        weights = idf * tfs * (self.k1 + 1) / (tfs + self.length_norm[doc_ids])
+        return np.bincount(doc_ids, weights=weights, minlength=len(self.ids)).astype(np.float32)
+
+    def search(self, query, k=2, title=None, prefix=False):
+        scores = self.scores(query)
+        rows = np.arange(len(scores)) if title is None else title_rows(self.titles, title, prefix)
+        return [
+            SearchResult(self.ids[row], self.texts[row], json.loads(self.metadatas[row]), float(scores[row]))
+            for row in rows[top_k(scores[rows], k)]
+            if scores[row] > 0
+        ]
@@ -0,0 +1,156 @@
+import re
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from retrieval.flat import normalize
+
+'''
+Bounded caches for the squad_retriever tool. The ReAct loop often repeats a query across
+steps, and the app's canned examples repeat it across users, so results and query
+embeddings are kept in small LRU caches with a time to live, shared by every session.
+Rephrased repeats miss an exact cache, so SemanticCache also matches them by embedding.
+'''
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """Case, surrounding punctuation and runs of whitespace don't change what a query retrieves."""
+    return WHITESPACE.sub(" ", query).strip().strip("?!.,;:'\" ").casefold()
+
+
+class LRUCache:
+    """
+    A thread-safe LRU cache holding at most maxsize entries, each for at most ttl seconds
+    (forever if ttl is None). Hits and misses are counted for stats().
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl is not None and self.clock() - entry[1] > self.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (value, self.clock())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+        }
+
+
+class SemanticCache:
+    """
+    Serves the value stored for a recent query whose embedding has a cosine similarity of at
+    least threshold with the new one. Embeddings are kept normalized in one matrix, so a
+    lookup is a single matrix-vector product; when full, the least recently used entry is
+    evicted. Entries only match lookups with the same key (e.g. the same title filter).
+    """
+
+    def __init__(self, maxsize=256, threshold=0.95):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.embeddings = None
+        self.keys = [None] * maxsize
+        self.values = [None] * maxsize
+        self.last_used = np.zeros(maxsize, dtype=np.int64)
+        self.size = 0
+        self.clock = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return self.size
+
+    def nearest(self, embedding, key):
+        """Returns (slot, similarity) of the most similar entry stored under key, or (None, 0)."""
+        if self.size == 0:
+            return None, 0.0
+        similarities = self.embeddings[:self.size] @ embedding
+        matching = np.array([k == key for k in self.keys[:self.size]])
+        similarities[~matching] = -np.inf
+        slot = int(np.argmax(similarities))
+        return (slot, float(similarities[slot])) if matching[slot] else (None, 0.0)
+
+    def get(self, embedding, key=None, default=None):
+        embedding = normalize(embedding)
+        with self.lock:
+            slot, similarity = self.nearest(embedding, key)
+            if slot is None or similarity < self.threshold:
+                self.misses += 1
+                return default
+            self.clock += 1
+            self.last_used[slot] = self.clock
+            self.hits += 1
+            return self.values[slot]
+
+    def put(self, embedding, value, key=None):
+        if self.maxsize <= 0:
+            return
+        embedding = normalize(embedding)
+        with self.lock:
+            if self.embeddings is None:
+                self.embeddings = np.zeros((self.maxsize, len(embedding)), dtype=np.float32)
+            if self.size < self.maxsize:
+                slot = self.size
+                self.size += 1
+            else:
+                slot = int(np.argmin(self.last_used))
+                self.evictions += 1
+            self.embeddings[slot] = embedding
+            self.keys[slot] = key
+            self.values[slot] = value
+            self.clock += 1
+            self.last_used[slot] = self.clock
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size": self.size,
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+        }
@@ -0,0 +1,174 @@
+import os
+import logging
+import json
+import numpy as np
+from typing import NamedTuple
+
+'''
+Exact in-process vector search, as an alternative to querying Chroma through llama-index.
+The embedding matrix is exported once from the Chroma collection and memory-mapped from
+disk, so several workers share one copy of the vectors through the page cache.
+'''
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.npy"
+DOCUMENTS_FILE = "documents.parquet"
+INFO_FILE = "info.json"
+
+# Keys llama-index adds to Chroma metadata for its own bookkeeping
+NODE_METADATA_KEYS = {"_node_content", "_node_type", "document_id", "doc_id", "ref_doc_id"}
+
+
+class SearchResult(NamedTuple):
+    """A retrieved document, shaped like llama-index's NodeWithScore for the fields the tools read."""
+    id: str
+    text: str
+    metadata: dict
+    score: float
+
+    @property
+    def node_id(self):
+        return self.id
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k(scores, k):
+    """Returns the indices of the k highest scores, best first, without sorting them all."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def title_rows(titles, title, prefix=False):
+    """Returns the rows whose title equals (or, with prefix, starts with) the given title."""
+    if prefix:
+        return np.flatnonzero(np.char.startswith(titles, title))
+    return np.flatnonzero(titles == title)
+
+
+def documents_frame(ids, texts, metadatas):
+    """The document table stored alongside an exported index, with titles as their own column."""
+    import pandas as pd
+    return pd.DataFrame({
+        "id": ids,
+        "text": texts,
+        "title": [str(metadata.get("title", "")) for metadata in metadatas],
+        "metadata": [json.dumps(metadata, ensure_ascii=False) for metadata in metadatas],
+    })
+
+
+def read_collection(collection, page_size=5000):
+    """Reads every id, text, metadata and embedding out of a Chroma collection."""
+    ids, texts, metadatas, embeddings = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(
+            include=["documents", "metadatas", "embeddings"], limit=page_size, offset=offset
+        )
+        ids.extend(page["ids"])
+        texts.extend(page["documents"])
+        metadatas.extend(
+            {k: v for k, v in (metadata or {}).items() if k not in NODE_METADATA_KEYS}
+            for metadata in page["metadatas"]
+        )
+        embeddings.extend(page["embeddings"])
+        if len(page["ids"]) < page_size:
+            return ids, texts, metadatas, np.asarray(embeddings, dtype=np.float32)
+        offset += page_size
+
+
+class FlatIndex:
+    """
+    Exact cosine search over a normalized embedding matrix. Vectors are stored as float16 by
+    default, which halves memory and page cache use; float32 storage scores several times
+    faster, since NumPy has no BLAS path for float16.
+    """
+
+    def __init__(self, path, block_size=1024):
+        self.path = path
+        import pandas as pd
+        self.embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+        documents = pd.read_parquet(os.path.join(path, DOCUMENTS_FILE))
+        self.ids = documents["id"].tolist()
+        self.texts = documents["text"].tolist()
+        self.metadatas = documents["metadata"].tolist()
+        self.titles = documents["title"].to_numpy(dtype=str)
+        with open(os.path.join(path, INFO_FILE), "r") as f:
+            self.info = json.load(f)
+        self.block_size = block_size
+
+    @staticmethod
+    def exists(path):
+        return all(os.path.exists(os.path.join(path, f)) for f in (EMBEDDINGS_FILE, DOCUMENTS_FILE, INFO_FILE))
+
+    @classmethod
+    def write(cls, path, ids, texts, metadatas, embeddings, dtype="float16", **info):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, EMBEDDINGS_FILE), normalize(embeddings).astype(dtype))
+        documents_frame(ids, texts, metadatas).to_parquet(os.path.join(path, DOCUMENTS_FILE), index=False)
+        with open(os.path.join(path, INFO_FILE), "w") as f:
+            json.dump(info, f, indent=2)
+
+    @classmethod
+    def from_collection(cls, collection, path, dtype="float16", **info):
+        """Exports a Chroma collection to path, and opens it."""
+        logger.info("Exporting %s to %s...", collection.name, path)
+        ids, texts, metadatas, embeddings = read_collection(collection)
+        cls.write(path, ids, texts, metadatas, embeddings, dtype=dtype, **info)
+        return cls(path)
+
+    @property
+    def corpus_hash(self):
+        return self.info.get("corpus_hash")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, queries, rows=None):
+        """
+        Scores normalized queries (one per column) against the stored vectors, or only
+        against the given rows (a slice keeps the memory map from being copied).
+        Returns a (documents, queries) float32 matrix.
+        """
+        embeddings = self.embeddings if rows is None else self.embeddings[rows]
+        queries = np.asarray(queries, dtype=np.float32)
+        if embeddings.dtype == np.float32:
+            return embeddings @ queries
+        # Upcast one block at a time, so float16 storage never needs a full float32 copy
+        out = np.empty((len(embeddings), queries.shape[1]), dtype=np.float32)
+        block = np.empty((self.block_size, embeddings.shape[1]), dtype=np.float32)
+        for start in range(0, len(embeddings), self.block_size):
+            rows_in_block = embeddings[start:start + self.block_size]
+            n = len(rows_in_block)
+            block[:n] = rows_in_block
+            np.matmul(block[:n], queries, out=out[start:start + n])
+        return out
+
+    def result(self, row, score):
+        return SearchResult(self.ids[row], self.texts[row], json.loads(self.metadatas[row]), float(score))
+
+    def ranked(self, rows, scores, k):
+        """The k best results from one query's scores over rows (every row if None)."""
+        return [self.result(i if rows is None else rows[i], scores[i]) for i in top_k(scores, k)]
+
+    def search(self, query_embedding, k=2, title=None, prefix=False):
+        """
+        Returns the k nearest documents. With a title, only that article's paragraphs (or,
+        with prefix, those of every article whose title starts with it) are scored.
+        """
+        return self.search_batch([query_embedding], k, title=title, prefix=prefix)[0]
+
+    def search_batch(self, query_embeddings, k=2, title=None, prefix=False):
+        """Like search, for several queries scored in one matrix product. Returns one list per query."""
+        queries = normalize(query_embeddings).T
+        rows = None if title is None else title_rows(self.titles, title, prefix)
+        scores = self.scores(queries, rows)
+        return [self.ranked(rows, scores[:, j], k) for j in range(queries.shape[1])]
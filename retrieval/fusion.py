@@ -0,0 +1,19 @@
+from retrieval.flat import SearchResult
+
+
+def reciprocal_rank_fusion(result_lists, k=2, rrf_k=60):
+    """
+    Fuses ranked result lists (e.g. dense and keyword) by reciprocal rank: each document
+    scores the sum of 1 / (rrf_k + rank) over the lists it appears in. Results only need
+    node_id, text, metadata and score, so Chroma's NodeWithScore and SearchResult mix freely.
+    """
+    scores, results = {}, {}
+    for result_list in result_lists:
+        for rank, result in enumerate(result_list):
+            scores[result.node_id] = scores.get(result.node_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+            results.setdefault(result.node_id, result)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [
+        SearchResult(node_id, results[node_id].text, results[node_id].metadata, scores[node_id])
+        for node_id in best
+    ]
@@ -0,0 +1,110 @@
+import os
+import logging
+import numpy as np
+from retrieval.flat import FlatIndex, normalize, top_k
+
+'''
+Approximate search for corpora too large to scan on every query. The vectors are
+k-means partitioned, stored sorted by partition, and a query only scores the nprobe
+partitions whose centroids are nearest to it. Raising nprobe trades latency for recall.
+'''
+
+logger = logging.getLogger(__name__)
+
+CENTROIDS_FILE = "centroids.npy"
+OFFSETS_FILE = "offsets.npy"
+
+
+def assign_partitions(vectors, centroids, block_size=4096):
+    """Returns the nearest (highest cosine) centroid of every normalized vector."""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block_size):
+        block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+        assignments[start:start + block_size] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def kmeans(vectors, n_clusters, iterations=20, sample_size=50000, seed=0):
+    """Spherical k-means on normalized vectors, trained on a sample of at most sample_size."""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign_partitions(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        # Re-seed empty partitions with random vectors
+        empty = counts == 0
+        sums[empty] = vectors[rng.choice(len(vectors), empty.sum())]
+        centroids = normalize(sums)
+    return centroids
+
+
+class IVFIndex(FlatIndex):
+    """
+    Inverted-file index over the same storage as FlatIndex. Rows are sorted by partition,
+    so each probed partition is a contiguous slice of the memory-mapped matrix.
+    """
+
+    def __init__(self, path, nprobe=None, **kwargs):
+        super().__init__(path, **kwargs)
+        self.centroids = np.load(os.path.join(path, CENTROIDS_FILE))
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE))
+        self.nprobe = nprobe or int(os.getenv("SQUAD_IVF_NPROBE", 8))
+
+    @staticmethod
+    def exists(path):
+        return FlatIndex.exists(path) and all(
+            os.path.exists(os.path.join(path, f)) for f in (CENTROIDS_FILE, OFFSETS_FILE)
+        )
+
+    @classmethod
+    def write(cls, path, ids, texts, metadatas, embeddings, dtype="float16", n_lists=None, **info):
+        embeddings = normalize(embeddings)
+        n_lists = min(n_lists or int(4 * np.sqrt(len(embeddings))), len(embeddings))
+        logger.info("Training %d partitions over %d vectors...", n_lists, len(embeddings))
+        centroids = kmeans(embeddings, n_lists)
+        assignments = assign_partitions(embeddings, centroids)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))])
+
+        super().write(
+            path,
+            [ids[i] for i in order],
+            [texts[i] for i in order],
+            [metadatas[i] for i in order],
+            embeddings[order],
+            dtype=dtype,
+            n_lists=n_lists,
+            **info,
+        )
+        np.save(os.path.join(path, CENTROIDS_FILE), centroids.astype(np.float32))
+        np.save(os.path.join(path, OFFSETS_FILE), offsets.astype(np.int64))
+
+    def probe(self, queries, nprobe):
+        """
+        Returns the row ranges of the partitions nearest to any of the normalized queries
+        (one per row), nprobe per query.
+        """
+        nprobe = min(nprobe, len(self.centroids))
+        nearest = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        return [(self.offsets[p], self.offsets[p + 1]) for p in np.unique(nearest)]
+
+    def search(self, query_embedding, k=2, title=None, prefix=False, nprobe=None):
+        return self.search_batch([query_embedding], k, title=title, prefix=prefix, nprobe=nprobe)[0]
+
+    def search_batch(self, query_embeddings, k=2, title=None, prefix=False, nprobe=None):
+        """
+        Scores every query against the union of the partitions probed for each, in one pass
+        over the matrix, so a batch reads each partition at most once.
+        """
+        if title is not None:
+            # A title narrows the search to a few hundred rows, so scan those exactly
+            return super().search_batch(query_embeddings, k, title=title, prefix=prefix)
+        queries = normalize(query_embeddings)
+        ranges = self.probe(queries, nprobe or self.nprobe)
+        rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+        scores = np.concatenate([self.scores(queries.T, slice(start, end)) for start, end in ranges])
+        return [self.ranked(rows, scores[:, j], k) for j in range(len(queries))]
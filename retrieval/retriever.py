@@ -0,0 +1,57 @@
+def embed_query(query, embed_model=None, cache=None):
+    """
+    Embeds a query with embed_model (the llama-index default if None), reusing the embedding
+    from cache (an LRUCache) when the same query was embedded before.
+    """
+    embedding = cache.get(query) if cache is not None else None
+    if embedding is None:
+        from llama_index.core import Settings
+        embedding = (embed_model or Settings.embed_model).get_query_embedding(query)
+        if cache is not None:
+            cache.put(query, embedding)
+    return embedding
+
+
+def embed_queries(queries, embed_model=None, cache=None):
+    """Like embed_query for several queries, embedding those missing from cache in one batch."""
+    embeddings = [cache.get(query) if cache is not None else None for query in queries]
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if not missing:
+        return embeddings
+    from llama_index.core import Settings
+    embed_model = embed_model or Settings.embed_model
+    if len(missing) == 1:
+        batch = [embed_model.get_query_embedding(queries[missing[0]])]
+    else:
+        # The models used here (local sentence-transformers or OpenAI) embed queries and
+        # documents alike, so the batch text endpoint embeds every query in one call
+        batch = embed_model.get_text_embedding_batch([queries[i] for i in missing])
+    for i, embedding in zip(missing, batch):
+        embeddings[i] = embedding
+        if cache is not None:
+            cache.put(queries[i], embedding)
+    return embeddings
+
+
+class VectorRetriever:
+    """
+    Retrieves from an in-process vector index (see VECTOR_INDEXES), embedding queries with
+    the same model the Chroma collection was built with.
+    """
+
+    def __init__(self, index, embed_model=None, similarity_top_k=2, embedding_cache=None):
+        self.index = index
+        self.embed_model = embed_model
+        self.similarity_top_k = similarity_top_k
+        self.embedding_cache = embedding_cache
+
+    def embed_query(self, query):
+        return embed_query(query, self.embed_model, self.embedding_cache)
+
+    def retrieve(self, query, title=None, prefix=False):
+        return self.index.search(self.embed_query(query), self.similarity_top_k, title=title, prefix=prefix)
+
+    def retrieve_batch(self, queries, title=None, prefix=False):
+        """Returns one result list per query, embedding and searching them all at once."""
+        embeddings = embed_queries(queries, self.embed_model, self.embedding_cache)
+        return self.index.search_batch(embeddings, self.similarity_top_k, title=title, prefix=prefix)
@@ -8,16 +8,24 @@ import torch.nn as nn
 class EmbeddingModelWrapper():
     DEFAULT_MODEL="sentence-transformers/all-mpnet-base-v2"
 
-    def __init__(self, model_path=None, bs=8):
+    def __init__(self, model_path=None, bs=8, device=None):
         if model_path is None: model_path = self.DEFAULT_MODEL
+        if device is None: device = self.default_device()
+        self.device = device
         self.model, self.tokenizer = self.load_model(model_path)
         self.bs = bs
         self.cos = nn.CosineSimilarity(dim=1, eps=1e-6)
 
+    @staticmethod
+    def default_device():
+        if torch.cuda.is_available(): return "cuda"
+        if torch.backends.mps.is_available(): return "mps"
+        return "cpu"
+
     def load_model(self, model_path):
         model = AutoModel.from_pretrained(
             model_path,
-        ).to("mps")
+        ).to(self.device)
         model.eval()
         tokenizer = AutoTokenizer.from_pretrained(
              model_path,
@@ -30,7 +38,7 @@ class EmbeddingModelWrapper():
         return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(input_mask_expanded.sum(1), min=1e-9)
 
     def get_embeddings(self, sentences):
-        embeddings=torch.tensor([],device="mps")
+        embeddings=torch.tensor([],device=self.device)
         
         if self.bs is None:
             batches=[sentences]
@@ -38,7 +46,7 @@ class EmbeddingModelWrapper():
             batches = [sentences[i:i + self.bs] for i in range(0, len(sentences), self.bs)]  
             
         for sentences in batches:
-            encoded_input = self.tokenizer(sentences, padding=True, truncation=True, return_tensors='pt').to("mps")
+            encoded_input = self.tokenizer(sentences, padding=True, truncation=True, return_tensors='pt').to(self.device)
             with torch.no_grad():
                 model_output = self.model(**encoded_input)        
             batch_embeddings=self.emb_mean_pooling(model_output, encoded_input['attention_mask'])
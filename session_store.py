@@ -0,0 +1,91 @@
+import os
+import time
+import zlib
+import pickle
+import sqlite3
+import threading
+from retrieval.cache import LRUCache
+
+'''
+Storage for chat sessions: each session's chat history and agent logs. Only recently
+active sessions are kept in memory (LRU, with a time to live since last use). With a path,
+every update writes just the fields that changed, for just that session, as a compressed
+row in SQLite, so its cost doesn't grow with the number of sessions; sessions evicted from
+memory are loaded back from disk when they resume.
+'''
+
+FIELDS = ("chat", "logs")
+
+
+def dumps(value):
+    return zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def loads(blob):
+    return pickle.loads(zlib.decompress(blob)) if blob is not None else None
+
+
+class SessionStore:
+    def __init__(self, path=None, max_sessions=None, ttl=None):
+        self.memory = LRUCache(
+            maxsize=max_sessions or int(os.getenv("SESSION_CACHE_SIZE", 1000)),
+            ttl=ttl or float(os.getenv("SESSION_TTL", 3600)),
+        )
+        self.path = path
+        self.connection = None
+        self.lock = threading.Lock()
+        if path is not None:
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, chat BLOB, logs BLOB, updated REAL)"
+            )
+
+    def get(self, session_id):
+        """Returns the session's fields (empty for a new session), loading it from disk if needed."""
+        session = self.memory.get(session_id)
+        if session is None:
+            session = self.load(session_id)
+            self.memory.put(session_id, session)
+        return session
+
+    def load(self, session_id):
+        if self.connection is None:
+            return {}
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT chat, logs FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return {}
+        return {field: loads(blob) for field, blob in zip(FIELDS, row) if blob is not None}
+
+    def update(self, session_id, **fields):
+        """Sets some of the session's fields (chat, logs), and writes only those."""
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown session fields {unknown}, expected some of {FIELDS}")
+        session = self.get(session_id)
+        session.update(fields)
+        self.memory.put(session_id, session)
+        if self.connection is None:
+            return
+        columns = list(fields)
+        blobs = [dumps(fields[column]) for column in columns]
+        with self.lock, self.connection:
+            self.connection.execute(
+                f"INSERT INTO sessions (id, {', '.join(columns)}, updated) VALUES (?, {', '.join('?' * len(columns))}, ?) "
+                f"ON CONFLICT(id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in columns)}, updated = excluded.updated",
+                [session_id, *blobs, time.time()],
+            )
+
+    def import_pickle(self, path):
+        """Imports sessions from the whole-dict pickle the app used to write, keyed hash and hash + "_logs"."""
+        with open(path, "rb") as f:
+            sessions = pickle.load(f)
+        for key, value in sessions.items():
+            if key.endswith("_logs"):
+                self.update(key[:-len("_logs")], logs=value)
+            else:
+                self.update(key, chat=value)
+        return len(sessions)
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+'''
+Timing spans for the phases of a request: the agent run, each step, LLM calls, Python
+interpreter steps, squad_retriever searches and UI rendering. Each span's duration goes into
+a latency histogram per phase, and its token counts and cache hits into counters. Spans
+opened inside another on the same thread (e.g. squad_retriever inside an interpreter step)
+share its trace id. The histograms can be scraped as Prometheus text (serve()), and with a
+trace path every span is also appended to a JSONL file:
+
+    SQUAD_TRACE_PATH=trace.jsonl SQUAD_METRICS_PORT=9100 python app.py
+    curl http://127.0.0.1:9100/metrics
+'''
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Numeric span attributes with these suffixes (prompt_tokens, cache_hits...) are also counted
+COUNTED_SUFFIXES = ("_tokens", "_hits", "_misses")
+
+
+class Histogram:
+    """Counts of observations at or below each bucket's bound (and above all of them), with their sum."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(bound, observations at or below it) per bucket, ending with ("+Inf", count)."""
+        total = 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            total += count
+            yield bound, total
+
+
+class Telemetry:
+    def __init__(self, trace_path=None):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.histograms = {}
+        self.counters = {}
+        self.trace_file = open(trace_path, "a", encoding="utf-8") if trace_path else None
+
+    @staticmethod
+    def new_trace():
+        return uuid.uuid4().hex[:16]
+
+    @contextmanager
+    def span(self, phase, trace=None, **attributes):
+        """
+        Times the block as a span of phase. The span (a dict) is yielded so the block can add
+        attributes, e.g. span["prompt_tokens"] = 1200. Without a trace id, it joins the trace of
+        the span it runs in, or starts a new one.
+        """
+        stack = self.local.__dict__.setdefault("stack", [])
+        parent = stack[-1] if stack else None
+        span = {
+            "trace": trace or (parent["trace"] if parent else self.new_trace()),
+            "span": uuid.uuid4().hex[:8],
+            "parent": parent["span"] if parent else None,
+            "phase": phase,
+            "start": time.time(),
+            **attributes,
+        }
+        stack.append(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span["error"] = type(e).__name__
+            raise
+        finally:
+            stack.pop()
+            self.record(span, time.perf_counter() - start)
+
+    def record(self, span, seconds):
+        """Records a finished span that took seconds, e.g. one timed without span()."""
+        span["seconds"] = seconds
+        phase = span["phase"]
+        with self.lock:
+            self.histograms.setdefault(phase, Histogram()).observe(seconds)
+            for name, value in span.items():
+                if name.endswith(COUNTED_SUFFIXES) and isinstance(value, (int, float)):
+                    self.counters[(name, phase)] = self.counters.get((name, phase), 0) + value
+            if self.trace_file is not None:
+                self.trace_file.write(json.dumps(span, default=str) + "\n")
+                self.trace_file.flush()
+
+    def stats(self):
+        """Count, total and mean seconds per phase, and the counters, e.g. for a notebook."""
+        with self.lock:
+            return {
+                "phases": {
+                    phase: {"count": h.count, "seconds": h.sum, "mean": h.sum / h.count if h.count else 0.0}
+                    for phase, h in self.histograms.items()
+                },
+                "counters": {f"{name}{{phase={phase}}}": value for (name, phase), value in self.counters.items()},
+            }
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP squad_span_seconds Duration of each phase of agent requests",
+            "# TYPE squad_span_seconds histogram",
+        ]
+        with self.lock:
+            for phase, histogram in sorted(self.histograms.items()):
+                for bound, count in histogram.cumulative():
+                    lines.append(f'squad_span_seconds_bucket{{phase="{phase}",le="{bound}"}} {count}')
+                lines.append(f'squad_span_seconds_sum{{phase="{phase}"}} {histogram.sum}')
+                lines.append(f'squad_span_seconds_count{{phase="{phase}"}} {histogram.count}')
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE squad_{name}_total counter")
+                for (counter, phase), value in sorted(self.counters.items()):
+                    if counter == name:
+                        lines.append(f'squad_{name}_total{{phase="{phase}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host="127.0.0.1", port=9100):
+        """Serves prometheus_text() at /metrics from a daemon thread, and returns the server."""
+        telemetry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                payload = telemetry.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        logger.info("Serving metrics on http://%s:%s/metrics", host, server.server_port)
+        return server
+
+
+# Shared by every module, so all phases of a request end up in the same histograms and trace
+telemetry = Telemetry(trace_path=os.getenv("SQUAD_TRACE_PATH"))
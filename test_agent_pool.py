@@ -0,0 +1,57 @@
+import time
+import threading
+import pytest
+from agent_pool import AgentPool, PoolTimeout
+
+
+class FakeAgent:
+    def __init__(self):
+        self.logs = []
+
+
+def test_agent_pool_reuses_agents_and_isolates_logs():
+    pool = AgentPool(FakeAgent, size=2, timeout=1)
+    session_logs = [{"task": "first"}]
+    with pool.checkout(logs=session_logs) as agent:
+        assert agent.logs is session_logs
+        agent.logs.append({"task": "second"})
+    assert session_logs == [{"task": "first"}, {"task": "second"}]
+    with pool.checkout() as again:
+        assert again is agent
+        # The previous session's logs don't leak into the next one
+        assert again.logs == []
+    assert pool.stats()["created"] == 1
+
+
+def test_agent_pool_bounds_concurrent_checkouts():
+    pool = AgentPool(FakeAgent, size=2, timeout=2)
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def session():
+        with pool.checkout():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+
+    threads = [threading.Thread(target=session) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = pool.stats()
+    assert peak[0] == 2
+    assert (stats["created"], stats["checkouts"], stats["in_use"]) == (2, 6, 0)
+    assert stats["wait_p99"] > 0
+
+
+def test_agent_pool_times_out_when_every_agent_is_busy():
+    pool = AgentPool(FakeAgent, size=1, timeout=0.05)
+    with pool.checkout():
+        with pytest.raises(PoolTimeout):
+            with pool.checkout():
+                pass
+    assert pool.stats()["timeouts"] == 1
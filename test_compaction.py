@@ -0,0 +1,38 @@
+from compaction import compact_logs, history_tokens
+
+
+def turn(task, observation, answer, first=False):
+    start = {"system_prompt": "You are an agent.", "task": task} if first else {"task": task}
+    return [
+        start,
+        {"agent_memory": [{"role": "system", "content": "x" * 1000}], "llm_output": "Thought: search", "observation": observation},
+        {"llm_output": f"Code:\nfinal_answer('{answer}')", "observation": "", "final_answer": answer},
+    ]
+
+
+def test_compact_logs_keeps_small_histories_verbatim():
+    logs = turn("What is on top of Notre Dame?", "a golden statue", "a golden statue", first=True)
+    compacted, report = compact_logs(logs, max_tokens=10000)
+    assert report["before"] == report["after"]
+    # Only the agent_memory snapshot, which is never sent to the LLM, is dropped
+    assert "agent_memory" not in compacted[1]
+    assert compacted[1]["observation"] == "a golden statue"
+
+
+def test_compact_logs_collapses_earlier_turns_under_budget():
+    long_observation = "Notre Dame paragraph. " * 400
+    logs = (
+        turn("What is on top of Notre Dame?", long_observation, "a golden statue", first=True)
+        + turn("What is the dome made of?", long_observation, "gold")
+        + turn("Who is Beyoncé?", "a singer", "a singer")
+    )
+    compacted, report = compact_logs(logs, max_tokens=300, keep_recent_steps=3)
+    assert report["after"] < report["before"]
+    assert report["after"] <= 300
+    assert report["after"] == history_tokens(compacted)
+    # The system prompt entry stays first, and the latest turn is kept verbatim
+    assert compacted[0]["system_prompt"] == "You are an agent."
+    assert compacted[-3:] == [{k: v for k, v in step.items() if k != "agent_memory"} for step in logs[-3:]]
+    # Earlier turns keep their task and final answer
+    assert compacted[1]["observation"] == "Final answer: a golden statue"
+    assert compacted[2]["task"] == "What is the dome made of?"
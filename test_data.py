@@ -0,0 +1,111 @@
+import os
+import json
+import data
+from data import load_squad_qas
+
+SQUAD_SAMPLE = {
+    "data": [
+        {
+            "title": "University_of_Notre_Dame",
+            "paragraphs": [
+                {
+                    "context": "Atop the Main Building's gold dome is a golden statue of the Virgin Mary.",
+                    "qas": [
+                        {
+                            "question": "What sits on top of the Main Building at Notre Dame?",
+                            "answers": [
+                                {"text": "a golden statue of the Virgin Mary"},
+                                {"text": "a golden statue of the Virgin Mary"},
+                                {"text": "golden statue"},
+                            ],
+                        },
+                        {
+                            "question": "What is the dome made of?",
+                            "answers": [{"text": "gold"}],
+                        },
+                    ],
+                },
+            ],
+        },
+        {
+            "title": "Beyoncé",
+            "paragraphs": [
+                {
+                    "context": "Beyoncé Giselle Knowles-Carter is an American singer.",
+                    "qas": [
+                        {
+                            "question": "What is Beyoncé's profession?",
+                            "answers": [{"text": "singer"}],
+                        },
+                    ],
+                },
+            ],
+        },
+    ]
+}
+
+
+def write_sample(path, sample=SQUAD_SAMPLE):
+    with open(path, "w") as f:
+        json.dump(sample, f)
+
+
+def test_load_squad_qas_parses_and_dedups_answers(tmp_path):
+    path = tmp_path / "train.json"
+    write_sample(path)
+    qas = load_squad_qas(str(path), cache_dir=str(tmp_path / "cache"))
+
+    assert list(qas.columns) == ["Title", "Context", "Question", "Answers"]
+    assert len(qas) == 3
+    assert list(qas["Answers"][0]) == ["a golden statue of the Virgin Mary", "golden statue"]
+
+
+def test_load_squad_qas_cache_is_keyed_on_the_source(tmp_path, monkeypatch):
+    path = tmp_path / "train.json"
+    cache_dir = tmp_path / "cache"
+    write_sample(path)
+    load_squad_qas(str(path), cache_dir=str(cache_dir))
+    assert len(os.listdir(cache_dir)) == 1
+
+    # A cache hit doesn't parse the source again
+    def fail(path):
+        raise AssertionError("source was parsed on a cache hit")
+    monkeypatch.setattr(data, "iter_squad_qas", fail)
+    assert len(load_squad_qas(str(path), cache_dir=str(cache_dir))) == 3
+    monkeypatch.undo()
+
+    # A changed source is parsed again, and replaces the older cache
+    sample = json.loads(json.dumps(SQUAD_SAMPLE))
+    sample["data"].pop()
+    write_sample(path, sample)
+    assert len(load_squad_qas(str(path), cache_dir=str(cache_dir))) == 2
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_load_squad_qas_survives_an_unwritable_cache(tmp_path):
+    path = tmp_path / "train.json"
+    write_sample(path)
+    # A file where the cache directory should be makes every write fail with an OSError
+    cache_dir = tmp_path / "cache"
+    cache_dir.write_text("")
+    assert len(load_squad_qas(str(path), cache_dir=str(cache_dir))) == 3
+
+
+def test_paragraph_documents_link_questions_to_each_paragraph(tmp_path):
+    path = tmp_path / "train.json"
+    write_sample(path)
+    documents = data.paragraph_documents(load_squad_qas(str(path), cache_dir=str(tmp_path / "cache")))
+
+    assert len(documents) == 2
+    notre_dame, beyonce = documents
+    assert notre_dame.text.startswith("Atop the Main Building")
+    assert notre_dame.metadata["title"] == "University_of_Notre_Dame"
+    assert notre_dame.metadata["paragraph_id"] == "University_of_Notre_Dame/0"
+    qas = json.loads(notre_dame.metadata["qas"])
+    assert [qa["question"] for qa in qas] == [
+        "What sits on top of the Main Building at Notre Dame?",
+        "What is the dome made of?",
+    ]
+    assert qas[0]["answers"] == ["a golden statue of the Virgin Mary", "golden statue"]
+    # Non-ASCII text is stored as is, not escaped
+    assert "Beyoncé's" in beyonce.metadata["qas"]
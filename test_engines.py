@@ -0,0 +1,167 @@
+import json
+import time
+import threading
+import pytest
+import openai
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from engines import Backoff, CachedEngine, CacheMiss, OpenAIModel, SharedClient, stream_to
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers chat completions with the server's scripted (status, delay) responses, in order,
+    streaming server.content a few characters at a time when asked to stream.
+    """
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        status, delay = self.server.script.pop(0) if self.server.script else (200, 0)
+        self.server.requests += 1
+        time.sleep(delay)
+        if status == 200 and request.get("stream"):
+            return self.stream(self.server.content)
+        body = {"error": {"message": "scripted error"}}
+        if status == 200:
+            body = {
+                "id": "stub",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "stub",
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": self.server.content}, "finish_reason": "stop"}
+                ],
+            }
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def stream(self, content, chunk_size=3):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        try:
+            for start in range(0, len(content), chunk_size):
+                chunk = {
+                    "id": "stub",
+                    "object": "chat.completion.chunk",
+                    "created": 0,
+                    "model": "stub",
+                    "choices": [{"index": 0, "delta": {"content": content[start:start + chunk_size]}}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                self.server.chunks_sent += 1
+                time.sleep(0.01)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.script = []
+    server.requests = 0
+    server.content = "Hello"
+    server.chunks_sent = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = SharedClient(api_key="test", base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    yield server, client
+    client.close()
+    server.shutdown()
+
+
+MESSAGES = [{"role": "user", "content": "Hi"}]
+
+
+def test_openai_model_retries_rate_limits_and_server_errors(stub_server):
+    server, client = stub_server
+    server.script = [(429, 0), (503, 0)]
+    model = OpenAIModel("stub", client=client, backoff=Backoff(base=0.01), stream=False)
+    assert model(MESSAGES) == "Hello"
+    assert server.requests == 3
+
+
+def test_openai_model_gives_up_at_the_deadline(stub_server):
+    server, client = stub_server
+    server.script = [(200, 2)]
+    model = OpenAIModel("stub", client=client, timeout=0.3, backoff=Backoff(base=0.01))
+    start = time.monotonic()
+    with pytest.raises((openai.APITimeoutError, TimeoutError)):
+        model(MESSAGES)
+    assert time.monotonic() - start < 1.5
+
+
+def test_openai_model_serves_concurrent_async_calls(stub_server):
+    import asyncio
+    server, client = stub_server
+    server.script = [(200, 0.2)] * 8
+    model = OpenAIModel("stub", client=client)
+
+    async def run():
+        return await asyncio.gather(*(model.acall(MESSAGES) for _ in range(8)))
+
+    start = time.monotonic()
+    assert asyncio.run(run()) == ["Hello"] * 8
+    # The calls overlap on one event loop rather than running one after another
+    assert time.monotonic() - start < 1.2
+
+
+def test_openai_model_streams_and_stops_at_stop_sequences(stub_server):
+    server, client = stub_server
+    server.content = "Thought: easy.\nCode:\n```py\nfinal_answer('gold')\n```<end_action>" + " ignored" * 200
+    model = OpenAIModel("stub", client=client)
+    partials = []
+    with stream_to(partials.append):
+        output = model(MESSAGES, stop_sequences=["<end_action>", "Observation:"])
+    assert output == "Thought: easy.\nCode:\n```py\nfinal_answer('gold')\n```"
+    assert len(partials) > 5
+    assert all(output.startswith(partial) for partial in partials)
+    # Generation was cut off at the stop sequence instead of running to the end
+    time.sleep(0.1)
+    assert server.chunks_sent < len(server.content) // 3
+
+
+class CountingEngine:
+    model_name = "counting"
+    temperature = 0.5
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, messages, stop_sequences=[]):
+        self.calls += 1
+        return f"response {self.calls}"
+
+
+def test_cached_engine_records_then_replays(tmp_path):
+    path = str(tmp_path / "llm.sqlite")
+    engine = CountingEngine()
+    recorder = CachedEngine(engine, mode="record", path=path)
+    assert recorder(MESSAGES, stop_sequences=["<end_action>"]) == "response 1"
+    assert recorder(MESSAGES, stop_sequences=["<end_action>"]) == "response 1"
+    assert engine.calls == 1
+    # Other stop sequences make another prompt
+    assert recorder(MESSAGES) == "response 2"
+
+    replayer = CachedEngine(CountingEngine(), mode="replay", path=path)
+    assert replayer(MESSAGES, stop_sequences=["<end_action>"]) == "response 1"
+    with pytest.raises(CacheMiss):
+        replayer([{"role": "user", "content": "Something new"}])
+    assert replayer.engine.calls == 0
+    assert replayer.model_name == "counting"
+
+
+def test_cached_engine_passthrough_always_calls_the_engine(tmp_path):
+    engine = CountingEngine()
+    passthrough = CachedEngine(engine, mode="passthrough", path=str(tmp_path / "llm.sqlite"))
+    passthrough(MESSAGES)
+    passthrough(MESSAGES)
+    assert engine.calls == 2
+    assert not (tmp_path / "llm.sqlite").exists()
@@ -0,0 +1,66 @@
+import pytest
+from llama_index.core import Document
+from index_builder import IndexBuilder, document_id
+
+
+class FakeEmbedder:
+    """Records which texts it embedded, and can fail after a number of batches."""
+
+    def __init__(self, fail_after=None):
+        self.embedded = []
+        self.fail_after = fail_after
+
+    def embed_batches(self, batches):
+        for i, batch in enumerate(batches):
+            if self.fail_after is not None and i == self.fail_after:
+                raise RuntimeError("embedding crashed")
+            self.embedded.extend(batch)
+            yield [[float(len(text)), 1.0, 0.0] for text in batch]
+
+
+def make_documents(n, prefix="Paragraph"):
+    return [Document(text=f"{prefix} {i}") for i in range(n)]
+
+
+def make_builder(path, embedder):
+    return IndexBuilder(path=str(path), collection_name="test", batch_size=2,
+                        write_batch_size=2, embedder=embedder)
+
+
+def test_interrupted_build_resumes_without_re_embedding(tmp_path):
+    documents = make_documents(6)
+
+    with pytest.raises(RuntimeError):
+        make_builder(tmp_path, FakeEmbedder(fail_after=2)).build(documents)
+    builder = make_builder(tmp_path, FakeEmbedder())
+    assert builder.collection.count() == 4
+    assert builder.needs_build()
+
+    embedded, deleted = builder.build(documents)
+    assert (embedded, deleted) == (2, 0)
+    assert sorted(builder.embedder.embedded) == ["Paragraph 4", "Paragraph 5"]
+    assert builder.collection.count() == 6
+    assert not builder.needs_build()
+
+
+def test_changed_document_is_re_embedded_and_old_id_deleted(tmp_path):
+    documents = make_documents(3)
+    make_builder(tmp_path, FakeEmbedder()).build(documents)
+
+    changed = documents[:2] + [Document(text="Paragraph 2, revised")]
+    builder = make_builder(tmp_path, FakeEmbedder())
+    assert builder.build(changed) == (1, 1)
+    assert builder.embedder.embedded == ["Paragraph 2, revised"]
+    assert builder.existing_ids() == {document_id(d) for d in changed}
+
+
+def test_unchanged_corpus_is_not_re_embedded(tmp_path):
+    documents = make_documents(3)
+    make_builder(tmp_path, FakeEmbedder()).build(documents, source={"size": 1}, version=1)
+
+    builder = make_builder(tmp_path, FakeEmbedder())
+    assert builder.needs_build(source={"size": 2}, version=1)
+    assert builder.needs_build(source={"size": 1}, version=2)
+    assert builder.build(documents, source={"size": 2}, version=1) == (0, 0)
+    assert builder.embedder.embedded == []
+    assert not builder.needs_build(source={"size": 2}, version=1)
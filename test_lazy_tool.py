@@ -0,0 +1,45 @@
+import threading
+from transformers.agents.tools import Tool
+from tools.lazy_tool import LazyTool, warm_up
+
+
+class EchoTool(Tool):
+    name = "echo"
+    description = "Echoes its text."
+    inputs = {"text": {"type": "string", "description": "The text to echo"}}
+    output_type = "string"
+    created = 0
+
+    def __init__(self):
+        super().__init__()
+        EchoTool.created += 1
+
+    def forward(self, text):
+        return text
+
+
+def test_lazy_tool_has_the_tool_metadata_and_loads_on_first_call():
+    EchoTool.created = 0
+    tool = LazyTool(EchoTool)
+    assert (tool.name, tool.description, tool.inputs, tool.output_type) == (
+        EchoTool.name, EchoTool.description, EchoTool.inputs, EchoTool.output_type
+    )
+    assert not tool.loaded and EchoTool.created == 0
+
+    threads = [threading.Thread(target=tool, args=("hi",)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert tool(text="hello") == "hello"
+    assert EchoTool.created == 1
+
+
+def test_warm_up_loads_lazy_tools_in_the_background():
+    EchoTool.created = 0
+    tools = [LazyTool(EchoTool), LazyTool(EchoTool, factory=lambda: 1 / 0)]
+    warm_up(tools).join(timeout=10)
+    assert tools[0].loaded
+    # A tool that fails to load is left to fail on its first call
+    assert not tools[1].loaded
+    assert EchoTool.created == 1
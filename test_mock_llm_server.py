@@ -0,0 +1,41 @@
+import threading
+import pytest
+from engines import OpenAIModel, SharedClient
+from mock_llm_server import make_server, scripted_completion
+
+SYSTEM = {"role": "system", "content": 'Here is an example.\nTask: "What is on top of the Notre Dame building?"'}
+TASK = {"role": "user", "content": "Task: What sits on top of the Main Building at Notre Dame?"}
+STEP = {"role": "assistant", "content": "Thought: search\nCode:\n```py\nprint(squad_retriever(query='...'))\n```"}
+OBSERVATION = {
+    "role": "user",
+    "content": "[OUTPUT OF STEP 0] -> Observation:\nPrint outputs:\n===Document===\n"
+    "Question: What sits on top of the Main Building at Notre Dame?\n"
+    "Acceptable Answers:\n['1. a golden statue of the Virgin Mary']",
+}
+
+
+def test_scripted_completion_retrieves_then_answers():
+    first = scripted_completion([SYSTEM, TASK])
+    assert "squad_retriever(query='What sits on top of the Main Building at Notre Dame?')" in first
+    second = scripted_completion([SYSTEM, TASK, STEP, OBSERVATION])
+    assert "final_answer('a golden statue of the Virgin Mary')" in second
+    # A follow-up task in the same conversation starts over with a retrieval
+    follow_up = {"role": "user", "content": "New task:\nWhat is the dome made of?"}
+    assert "squad_retriever(query='What is the dome made of?')" in scripted_completion(
+        [SYSTEM, TASK, STEP, OBSERVATION, follow_up]
+    )
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_mock_server_speaks_the_openai_api(stream):
+    server = make_server(port=0, latency=0, chunk_delay=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = SharedClient(api_key="mock", base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    try:
+        model = OpenAIModel("mock", client=client, stream=stream)
+        output = model([SYSTEM, TASK], stop_sequences=["<end_action>", "Observation:"])
+        assert output.endswith("```")
+        assert "squad_retriever" in output
+    finally:
+        client.close()
+        server.shutdown()
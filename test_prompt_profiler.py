@@ -0,0 +1,38 @@
+from transformers.agents.llm_engine import MessageRole
+from prompt_profiler import PromptProfiler, ProfiledEngine, prompt_breakdown
+from tokens import count_tokens
+
+TOOLS = "- squad_retriever: Retrieves documents from SQuAD."
+SYSTEM = f"You are an agent with these tools:\n{TOOLS}\nAnswer the task."
+MESSAGES = [
+    {"role": MessageRole.SYSTEM, "content": SYSTEM},
+    {"role": MessageRole.USER, "content": "Task: What is on top of Notre Dame?"},
+    {"role": MessageRole.ASSISTANT, "content": "Thought: search\nCode:\n```py\nsquad_retriever('Notre Dame')\n```"},
+    {"role": MessageRole.TOOL_RESPONSE, "content": "[OUTPUT OF STEP 0] -> Observation:\na golden statue of the Virgin Mary"},
+]
+
+
+def test_prompt_breakdown_splits_prompt_into_parts():
+    parts = prompt_breakdown(MESSAGES, TOOLS)
+    assert parts["tools"] == count_tokens(TOOLS)
+    assert parts["system"] == count_tokens(SYSTEM) - count_tokens(TOOLS)
+    assert parts["history"] == count_tokens(MESSAGES[1]["content"]) + count_tokens(MESSAGES[2]["content"])
+    assert parts["observations"] == count_tokens(MESSAGES[3]["content"])
+    assert parts["prompt"] == sum(parts[part] for part in ("system", "tools", "history", "observations"))
+
+
+def test_profiler_counts_calls_prefixes_and_tokens_per_answer():
+    profiler = PromptProfiler()
+    engine = ProfiledEngine(lambda messages, stop_sequences=[]: "final_answer('a statue')", profiler, TOOLS)
+    engine(MESSAGES)
+    engine(MESSAGES[:2])
+    profiler.questions = profiler.answered = 1
+    summary = profiler.summary()
+    assert summary["calls"] == 2
+    # Both calls share the same system prompt, so the same prefix
+    assert summary["prefixes"] == 1
+    assert summary["total_tokens"] == sum(call["prompt"] + call["completion"] for call in profiler.calls)
+    assert summary["tokens_per_answer"] == summary["total_tokens"]
+
+    engine([{"role": MessageRole.SYSTEM, "content": SYSTEM + " "}] + MESSAGES[1:])
+    assert profiler.summary()["prefixes"] == 2
@@ -0,0 +1,37 @@
+import os
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def run(code, cwd):
+    env = {**os.environ, "PYTHONPATH": ROOT}
+    return subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True, text=True, check=True).stdout
+
+
+def test_prompts_are_found_from_any_directory_without_importing_them(tmp_path):
+    output = run(
+        "import sys, prompts\n"
+        "print(sorted(prompts.PROMPTS))\n"
+        "print(sorted(m for m in sys.modules if m.startswith('prompts.') or m == 'transformers'))\n",
+        cwd=tmp_path,
+    ).splitlines()
+    assert output[0] == str([
+        "DEFAULT_SQUAD_REACT_CODE_SYSTEM_PROMPT",
+        "FOCUSED_SQUAD_REACT_CODE_SYSTEM_PROMPT",
+        "SUCCINCT_SQUAD_REACT_CODE_SYSTEM_PROMPT",
+    ])
+    assert output[1] == "[]"
+
+
+def test_prompts_import_only_the_module_used(tmp_path):
+    output = run(
+        "import sys\n"
+        "from prompts import PROMPTS, FOCUSED_SQUAD_REACT_CODE_SYSTEM_PROMPT\n"
+        "from prompts.focused import FOCUSED_SQUAD_REACT_CODE_SYSTEM_PROMPT as direct\n"
+        "print(FOCUSED_SQUAD_REACT_CODE_SYSTEM_PROMPT is direct is PROMPTS['FOCUSED_SQUAD_REACT_CODE_SYSTEM_PROMPT'])\n"
+        "print(sorted(m for m in sys.modules if m.startswith('prompts.')))\n",
+        cwd=tmp_path,
+    ).splitlines()
+    assert output == ["True", "['prompts.focused']"]
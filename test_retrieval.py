@@ -0,0 +1,165 @@
+import numpy as np
+import pytest
+import json
+from retrieval import (
+    FlatIndex, IVFIndex, BM25Index, LRUCache, SemanticCache, SearchResult, normalize, normalize_query, top_k, reciprocal_rank_fusion,
+)
+
+
+def random_corpus(n=200, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(n, dim)).astype(np.float32)
+    ids = [f"id{i}" for i in range(n)]
+    texts = [f"Title: Article_{i % 10}\nContext: Paragraph {i}" for i in range(n)]
+    metadatas = [{"title": f"Article_{i % 10}"} for i in range(n)]
+    return ids, texts, metadatas, embeddings
+
+
+def brute_force(embeddings, query, k):
+    scores = normalize(embeddings) @ normalize(query)
+    return list(np.argsort(-scores)[:k])
+
+
+def test_top_k_returns_best_first():
+    scores = np.array([0.1, 0.9, 0.3, 0.7], dtype=np.float32)
+    assert list(top_k(scores, 2)) == [1, 3]
+    assert list(top_k(scores, 10)) == [1, 3, 2, 0]
+
+
+@pytest.mark.parametrize("dtype", ["float16", "float32"])
+def test_flat_index_matches_brute_force(tmp_path, dtype):
+    ids, texts, metadatas, embeddings = random_corpus()
+    FlatIndex.write(str(tmp_path), ids, texts, metadatas, embeddings, dtype=dtype, corpus_hash="abc")
+    index = FlatIndex(str(tmp_path), block_size=64)
+
+    assert index.corpus_hash == "abc"
+    assert isinstance(index.embeddings, np.memmap)
+    query = embeddings[17] + 0.01
+    results = index.search(query, k=5)
+    assert [r.id for r in results] == [ids[i] for i in brute_force(embeddings, query, 5)]
+    assert results[0].text == texts[17]
+    assert results[0].metadata == metadatas[17]
+    assert results[0].score == pytest.approx(1.0, abs=1e-2)
+
+
+def test_ivf_index_recall_grows_with_nprobe(tmp_path):
+    ids, texts, metadatas, embeddings = random_corpus(n=1000, dim=16)
+    IVFIndex.write(str(tmp_path), ids, texts, metadatas, embeddings, dtype="float32", n_lists=20)
+    index = IVFIndex(str(tmp_path))
+    assert index.offsets[-1] == len(ids)
+
+    rng = np.random.default_rng(1)
+    queries = rng.normal(size=(50, 16)).astype(np.float32)
+
+    def recall(nprobe):
+        hits = 0
+        for query in queries:
+            expected = {ids[i] for i in brute_force(embeddings, query, 5)}
+            hits += len(expected & {r.id for r in index.search(query, k=5, nprobe=nprobe)})
+        return hits / (5 * len(queries))
+
+    assert recall(1) <= recall(5) <= recall(20)
+    # Probing every partition is an exact search
+    assert recall(20) == 1.0
+
+
+def test_bm25_finds_exact_entities(tmp_path):
+    texts = [
+        "Title: University_of_Notre_Dame\nContext: Atop the Main Building's gold dome is a golden statue of the Virgin Mary.",
+        "Title: Beyoncé\nContext: Beyoncé rose to fame in the late 1990s as lead singer of Destiny's Child.",
+        "Title: Genome\nContext: In modern molecular biology the genome is the genetic material of an organism.",
+    ]
+    metadatas = [
+        {"qas": json.dumps([{"question": "What sits on top of the Main Building?", "answers": []}])},
+        {"qas": json.dumps([{"question": "When did Beyoncé become popular?", "answers": []}])},
+        {},
+    ]
+    BM25Index.write(str(tmp_path), ["a", "b", "c"], texts, metadatas, corpus_hash="abc")
+    index = BM25Index(str(tmp_path))
+
+    assert [r.id for r in index.search("Destiny's Child 1990s", k=2)] == ["b"]
+    assert index.search("notre dame dome", k=1)[0].id == "a"
+    # Linked questions are searchable too
+    assert index.search("popular", k=1)[0].id == "b"
+    assert index.search("xylophone", k=2) == []
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    dense = [SearchResult("a", "A", {}, 0.9), SearchResult("b", "B", {}, 0.8)]
+    lexical = [SearchResult("b", "B", {}, 12.0), SearchResult("c", "C", {}, 7.0)]
+    fused = reciprocal_rank_fusion([dense, lexical], k=3)
+    assert [r.node_id for r in fused] == ["b", "a", "c"]
+
+
+def test_title_filter_only_scores_that_article(tmp_path):
+    ids, texts, metadatas, embeddings = random_corpus()
+    metadatas[3]["title"] = "Article_30"
+    FlatIndex.write(str(tmp_path / "flat"), ids, texts, metadatas, embeddings)
+    IVFIndex.write(str(tmp_path / "ivf"), ids, texts, metadatas, embeddings, n_lists=8)
+    BM25Index.write(str(tmp_path / "bm25"), ids, texts, metadatas)
+
+    for index in (FlatIndex(str(tmp_path / "flat")), IVFIndex(str(tmp_path / "ivf"))):
+        results = index.search(embeddings[0], k=50, title="Article_3")
+        assert len(results) == 19
+        assert {r.metadata["title"] for r in results} == {"Article_3"}
+        results = index.search(embeddings[0], k=50, title="Article_3", prefix=True)
+        assert {r.metadata["title"] for r in results} == {"Article_3", "Article_30"}
+        assert index.search(embeddings[0], k=5, title="Missing") == []
+
+    bm25 = BM25Index(str(tmp_path / "bm25"))
+    results = bm25.search("paragraph 13 23 33", k=5, title="Article_3")
+    assert {r.id for r in results[:3]} == {"id13", "id23", "id33"}
+    assert {r.metadata["title"] for r in results} == {"Article_3"}
+
+
+def test_normalize_query_ignores_case_punctuation_and_spacing():
+    assert normalize_query("  What is on top of  Notre Dame? ") == normalize_query("what is on top of notre dame")
+
+
+def test_lru_cache_evicts_least_recently_used_and_expires():
+    now = [0.0]
+    cache = LRUCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)  # evicts "b", the least recently used
+    assert cache.get("b") is None
+    assert len(cache) == 2
+
+    now[0] = 11
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+@pytest.mark.parametrize("index_class", [FlatIndex, IVFIndex])
+def test_search_batch_matches_single_searches(tmp_path, index_class):
+    ids, texts, metadatas, embeddings = random_corpus()
+    index_class.write(str(tmp_path), ids, texts, metadatas, embeddings, dtype="float32")
+    index = index_class(str(tmp_path))
+    queries = np.random.default_rng(2).normal(size=(3, 16)).astype(np.float32)
+    batch = index.search_batch(queries, k=5)
+    assert len(batch) == 3
+    for query, results in zip(queries, batch):
+        single = index.search(query, k=5)
+        if index_class is FlatIndex:
+            assert [r.id for r in results] == [r.id for r in single]
+        else:
+            # A batch scores the partitions probed for any of its queries, so it finds at least as good results
+            assert results[-1].score >= single[-1].score - 1e-6
+
+
+def test_semantic_cache_serves_near_duplicates_and_evicts():
+    cache = SemanticCache(maxsize=2, threshold=0.9)
+    cache.put([1.0, 0.0, 0.0], "a")
+    cache.put([0.0, 1.0, 0.0], "b", key="title")
+    assert cache.get([0.99, 0.05, 0.0]) == "a"
+    assert cache.get([0.7, 0.7, 0.0]) is None  # below the threshold
+    assert cache.get([0.0, 1.0, 0.0]) is None  # stored under another key
+    assert cache.get([0.0, 1.0, 0.0], key="title") == "b"
+
+    cache.put([0.0, 0.0, 1.0], "c")  # evicts "a", the least recently used
+    assert cache.get([1.0, 0.0, 0.0]) is None
+    assert cache.get([0.0, 0.0, 1.0]) == "c"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (3, 3, 1)
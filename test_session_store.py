@@ -0,0 +1,38 @@
+import pickle
+import sqlite3
+from session_store import SessionStore
+
+
+def test_session_store_writes_only_the_changed_session(tmp_path):
+    path = str(tmp_path / "sessions.sqlite")
+    store = SessionStore(path, max_sessions=2)
+    store.update("a", chat=[{"role": "user", "content": "Hi"}])
+    store.update("b", chat=[], logs=[{"task": "b"}])
+    store.update("a", logs=[{"task": "a"}])
+
+    rows = sqlite3.connect(path).execute("SELECT id FROM sessions ORDER BY id").fetchall()
+    assert rows == [("a",), ("b",)]
+    assert store.get("a") == {"chat": [{"role": "user", "content": "Hi"}], "logs": [{"task": "a"}]}
+
+    # Sessions evicted from memory, or from another process, load lazily from disk
+    store.update("c", chat=[])
+    assert len(store.memory) == 2
+    assert SessionStore(path).get("b") == {"chat": [], "logs": [{"task": "b"}]}
+    assert SessionStore(path).get("new") == {}
+
+
+def test_session_store_without_a_path_keeps_recent_sessions_in_memory():
+    store = SessionStore(max_sessions=1)
+    store.update("a", chat=["a"])
+    assert store.get("a") == {"chat": ["a"]}
+    store.update("b", chat=["b"])
+    assert store.get("a") == {}
+
+
+def test_session_store_imports_the_legacy_pickle(tmp_path):
+    legacy = tmp_path / "sessions.pkl"
+    with open(legacy, "wb") as f:
+        pickle.dump({"a": ["chat"], "a_logs": [{"task": "a"}]}, f)
+    store = SessionStore(str(tmp_path / "sessions.sqlite"))
+    assert store.import_pickle(str(legacy)) == 2
+    assert store.get("a") == {"chat": ["chat"], "logs": [{"task": "a"}]}
@@ -0,0 +1,66 @@
+import json
+from retrieval import SearchResult
+import tools.squad_tools
+from tools.squad_tools import SquadRetrieverTool, format_results
+from tokens import count_tokens
+
+NOTRE_DAME = SearchResult(
+    "nd",
+    "Atop the Main Building's gold dome is a golden statue of the Virgin Mary.",
+    {
+        "title": "University_of_Notre_Dame",
+        "qas": json.dumps([
+            {"question": "What sits on top of the Main Building at Notre Dame?", "answers": ["a golden statue"]},
+            {"question": "What is the dome made of?", "answers": ["gold"]},
+        ]),
+    },
+    0.8,
+)
+BEYONCE = SearchResult(
+    "b",
+    "Beyoncé Giselle Knowles-Carter is an American singer. " * 50,
+    {"title": "Beyoncé", "qas": json.dumps([{"question": "What is Beyoncé's profession?", "answers": ["singer"]}])},
+    0.5,
+)
+
+
+def test_format_results_prints_each_paragraph_once():
+    output = format_results(
+        ["What is on top of Notre Dame?", "Notre Dame dome"], [[NOTRE_DAME], [NOTRE_DAME, BEYONCE]]
+    )
+    assert output.count("Atop the Main Building") == 1
+    assert output.count("===Document===") == 2
+    assert "Found by queries: 1, 2" in output
+
+
+def test_format_results_keeps_to_the_token_budget():
+    output = format_results(["Notre Dame"], [[NOTRE_DAME, BEYONCE]], max_tokens=100)
+    assert count_tokens(output) <= 100
+    assert "Atop the Main Building" in output
+    assert "1 more documents omitted" in output
+
+    # A single paragraph over budget is truncated rather than dropped
+    output = format_results(["Beyoncé"], [[BEYONCE]], max_tokens=50)
+    assert output.endswith("[truncated]")
+    assert count_tokens(output) <= 50
+
+
+def test_squad_retriever_loads_its_index_on_first_search(monkeypatch):
+    class LexicalData:
+        loads = 0
+
+        def __init__(self):
+            LexicalData.loads += 1
+
+        def lexical_index(self):
+            return self
+
+        def search(self, query, k, title=None, prefix=False):
+            return [NOTRE_DAME]
+
+    monkeypatch.setattr(tools.squad_tools, "get_data", lambda download: LexicalData())
+    tool = SquadRetrieverTool(mode="lexical", cache_size=0)
+    assert LexicalData.loads == 0
+    assert "Atop the Main Building" in tool.forward("Notre Dame")
+    tool.forward("Notre Dame dome")
+    assert LexicalData.loads == 1
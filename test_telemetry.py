@@ -0,0 +1,50 @@
+import json
+import urllib.request
+import pytest
+from telemetry import Histogram, Telemetry
+
+
+def test_spans_nest_into_one_trace_with_histograms_and_counters(tmp_path):
+    telemetry = Telemetry(trace_path=str(tmp_path / "trace.jsonl"))
+    with telemetry.span("step") as step:
+        with telemetry.span("llm", prompt_tokens=100) as llm:
+            llm["completion_tokens"] = 20
+            llm["cache_hits"] = 1
+        with pytest.raises(ValueError):
+            with telemetry.span("interpreter"):
+                raise ValueError("bad code")
+
+    spans = [json.loads(line) for line in open(tmp_path / "trace.jsonl")]
+    assert [span["phase"] for span in spans] == ["llm", "interpreter", "step"]
+    assert {span["trace"] for span in spans} == {step["trace"]}
+    assert spans[0]["parent"] == spans[1]["parent"] == step["span"]
+    assert spans[1]["error"] == "ValueError"
+    assert all(span["seconds"] >= 0 for span in spans)
+
+    stats = telemetry.stats()
+    assert {phase: s["count"] for phase, s in stats["phases"].items()} == {"llm": 1, "interpreter": 1, "step": 1}
+    assert stats["counters"] == {
+        "prompt_tokens{phase=llm}": 100,
+        "completion_tokens{phase=llm}": 20,
+        "cache_hits{phase=llm}": 1,
+    }
+
+
+def test_prometheus_histogram_buckets_are_cumulative():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert list(histogram.cumulative()) == [(0.1, 2), (1.0, 3), ("+Inf", 4)]
+
+    telemetry = Telemetry()
+    telemetry.record({"phase": "squad_retriever", "output_tokens": 300}, 0.02)
+    server = telemetry.serve(port=0)
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        text = urllib.request.urlopen(url, timeout=5).read().decode()
+    finally:
+        server.shutdown()
+    assert 'squad_span_seconds_bucket{phase="squad_retriever",le="0.025"} 1' in text
+    assert 'squad_span_seconds_bucket{phase="squad_retriever",le="0.01"} 0' in text
+    assert 'squad_span_seconds_count{phase="squad_retriever"} 1' in text
+    assert 'squad_output_tokens_total{phase="squad_retriever"} 300' in text
@@ -0,0 +1,48 @@
+import os
+import logging
+from functools import lru_cache
+
+'''
+Token counting for prompt budgets and reports, with the tokenizer of the OpenAI model the
+agent runs on (tiktoken is installed with llama-index). If tiktoken or its encoding files
+are unavailable, counts fall back to an estimate of four characters per token.
+'''
+
+logger = logging.getLogger(__name__)
+
+TOKENIZER_MODEL = os.getenv("SQUAD_TOKENIZER_MODEL", "gpt-4o-mini")
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model=TOKENIZER_MODEL):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # The encoding files are downloaded on first use, which fails offline
+        logger.warning("Could not load the %s tokenizer, estimating token counts instead: %s", model, e)
+        return None
+
+
+def count_tokens(text, model=TOKENIZER_MODEL):
+    encoding = get_encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, max_tokens, model=TOKENIZER_MODEL):
+    """Returns the longest prefix of text that is at most max_tokens tokens long."""
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
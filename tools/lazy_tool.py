@@ -0,0 +1,77 @@
+import logging
+import threading
+import transformers
+from transformers import load_tool
+from transformers.agents.tools import Tool, TOOL_MAPPING
+
+'''
+Lazy stand-ins for tools that download or load a model when they are created. The agent
+sees the same name, description, inputs and output type as the real tool, and the real
+tool is created on the first call, so the app can start serving before (or without) ever
+loading tools that most chats don't use. warm_up() loads them in a background thread.
+'''
+
+logger = logging.getLogger(__name__)
+
+
+class LazyTool(Tool):
+    """
+    Stands in for tool_class, creating the tool with factory() (tool_class() by default) the
+    first time it is called. Concurrent first calls create it only once.
+    """
+
+    def __init__(self, tool_class, factory=None):
+        self.tool_class = tool_class
+        self.factory = factory or tool_class
+        self.name = tool_class.name
+        self.description = tool_class.description
+        self.inputs = tool_class.inputs
+        self.output_type = tool_class.output_type
+        self._tool = None
+        self.lock = threading.Lock()
+        super().__init__()
+
+    @classmethod
+    def from_task(cls, task, **kwargs):
+        """A lazy load_tool(task, **kwargs), for the tasks implemented in transformers."""
+        tool_class = getattr(transformers.agents, TOOL_MAPPING[task])
+        return cls(tool_class, factory=lambda: load_tool(task, **kwargs))
+
+    def validate_arguments(self):
+        # The attributes are the tool class's own, and the real tool validates its forward
+        # signature when it is created; this proxy's forward takes whatever that one does
+        pass
+
+    @property
+    def loaded(self):
+        return self._tool is not None
+
+    def load(self):
+        if self._tool is None:
+            with self.lock:
+                if self._tool is None:
+                    self._tool = self.factory()
+        return self._tool
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    def forward(self, *args, **kwargs):
+        return self.load().forward(*args, **kwargs)
+
+
+def warm_up(tools):
+    """Loads the lazy tools among tools, one after another, in a daemon thread, and returns the thread."""
+
+    def load_all():
+        for tool in tools:
+            if isinstance(tool, LazyTool) and not tool.loaded:
+                try:
+                    tool.load()
+                except Exception as e:
+                    # It will be retried, and the error raised, on the tool's first call
+                    logger.warning("Could not warm up the %s tool: %s", tool.name, e)
+
+    thread = threading.Thread(target=load_all, name="tool-warm-up", daemon=True)
+    thread.start()
+    return thread
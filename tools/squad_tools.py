@@ -1,5 +1,111 @@
+import os
+import re
+import json
+import threading
 from transformers.agents.tools import Tool
-from data import get_data
+from data import get_data, format_document, format_qas
+from tokens import count_tokens, truncate_tokens
+from telemetry import telemetry
+from retrieval import VectorRetriever, LRUCache, SemanticCache, embed_queries, normalize_query, reciprocal_rank_fusion
+
+# Candidates taken from each retriever before hybrid results are fused
+HYBRID_CANDIDATES = 10
+
+OMITTED_NOTE = "({} more documents omitted to stay within the token budget)"
+
+
+def relevant_qas(qas, query, max_qas):
+    """Returns the linked questions sharing the most words with the query, best first."""
+    words = set(re.findall(r"\w+", query.lower()))
+    return sorted(
+        qas,
+        key=lambda qa: len(words & set(re.findall(r"\w+", qa["question"].lower()))),
+        reverse=True,
+    )[:max_qas]
+
+
+def format_response(response, query, max_qas=2):
+    qas = relevant_qas(json.loads(response.metadata.get("qas", "[]")), query, max_qas)
+    document = format_document(response.metadata.get("title"), response.text)
+    return f"{document}\n{format_qas(qas)}\nScore: {response.score}"
+
+
+def format_responses(responses, query, max_qas=2):
+    if len(responses) == 0:
+        return "No documents found for this query."
+    return "===Document===\n" + "\n===Document===\n".join(
+        [
+            format_response(response, query, max_qas)
+            for response in responses
+        ]
+    )
+
+
+def group_by_context(queries, results):
+    """
+    Returns (response, numbers of the queries that found it) for each distinct paragraph,
+    best ranked first, so a paragraph found by several queries is listed once.
+    """
+    groups = {}
+    for rank in range(max((len(responses) for responses in results), default=0)):
+        for n, responses in enumerate(results, start=1):
+            if rank < len(responses):
+                response = responses[rank]
+                groups.setdefault(response.node_id, (response, []))[1].append(n)
+    return list(groups.values())
+
+
+def format_group(response, queries, numbers, max_qas=2):
+    """Formats a paragraph once, with the linked Q/As most relevant to any of the queries that found it."""
+    matched = " ".join(queries[n - 1] for n in numbers)
+    text = format_response(response, matched, max_qas * len(numbers))
+    if len(queries) > 1:
+        text += f"\nFound by queries: {', '.join(map(str, numbers))}"
+    return text
+
+
+def format_results(queries, results, max_tokens=None, max_qas=2):
+    """
+    Formats the results of one or more queries, grouped by paragraph, keeping to max_tokens
+    (if given): whole paragraphs are dropped from the lowest ranked up, and a single
+    paragraph that alone is over budget is truncated.
+    """
+    groups = group_by_context(queries, results)
+    if not groups:
+        return "No documents found for this query."
+    header = ""
+    if len(queries) > 1:
+        header = "Queries:\n" + "\n".join(f"{n}. {query}" for n, query in enumerate(queries, start=1)) + "\n"
+    sections = ["===Document===\n" + format_group(response, queries, numbers, max_qas) for response, numbers in groups]
+    if max_tokens is None:
+        return header + "\n".join(sections)
+
+    # Leave room for the note on omitted or truncated documents
+    budget = max_tokens - count_tokens(header) - count_tokens(f"\n{OMITTED_NOTE.format(len(sections))}")
+    kept = []
+    for section in sections:
+        tokens = count_tokens(section + "\n")
+        if tokens > budget:
+            if not kept:
+                kept.append(truncate_tokens(section, budget) + " [truncated]")
+            break
+        kept.append(section)
+        budget -= tokens
+    omitted = len(sections) - len(kept)
+    if omitted:
+        kept.append(OMITTED_NOTE.format(omitted))
+    return header + "\n".join(kept)
+
+
+def parse_title(title):
+    """Returns (title, prefix) for a title filter; a trailing '*' asks for a prefix match."""
+    if title is None or title.strip() in ("", "*"):
+        return None, False
+    title = title.strip()
+    if title.endswith("*"):
+        return title[:-1], True
+    return title, False
+
 
 class SquadRetrieverTool(Tool):
     name = "squad_retriever"
@@ -9,30 +115,186 @@ class SquadRetrieverTool(Tool):
         """
     inputs = {
         "query": {
+            "type": "any",
+            "description": "The query, or a list of queries to search for at once. "
+            "Be sure to pass this as a keyword argument and not a dictionary.",
+        },
+        "title": {
             "type": "string",
-            "description": "The query. Be sure to pass this as a keyword argument and not a dictionary.",
+            "description": "Optional. The SQuAD article title to search within, e.g. 'University_of_Notre_Dame'. "
+            "End it with '*' to search every article whose title starts with it, e.g. 'Notre_Dame*'.",
+            "nullable": True,
         },
     }
     output_type = "string"
 
-    def __init__(self, **kwargs):
+    def __init__(
+        self, backend=None, mode=None, similarity_top_k=2, cache_size=None, cache_ttl=None, max_tokens=None, **kwargs
+    ):
         super().__init__(**kwargs)
-        self.data = get_data(download=True)
-        self.retriever = self.data.index.as_retriever()
+        self.data = None
+        # "chroma" queries the collection through llama-index; "flat" and "ivf" search a
+        # memory-mapped copy of its vectors in-process
+        self.backend = backend or os.getenv("SQUAD_RETRIEVER_BACKEND", "chroma")
+        # "dense" uses the vector backend alone, "lexical" the BM25 index alone, and "hybrid"
+        # fuses both by reciprocal rank
+        self.mode = mode or os.getenv("SQUAD_RETRIEVER_MODE", "dense")
+        self.similarity_top_k = similarity_top_k
+        # Token budget for one call's output, which goes into the next LLM prompt
+        self.max_tokens = int(max_tokens if max_tokens is not None else os.getenv("SQUAD_RETRIEVER_MAX_TOKENS", 1500))
+        # Tokens of every output, and of the same results as one full document per hit per query
+        self.token_stats = {"calls": 0, "output_tokens": 0, "baseline_tokens": 0}
+        self.last_call_tokens = None
+        # Retrieved documents by normalized query, and query embeddings by query, shared by every session
+        self.cache = LRUCache(
+            maxsize=int(cache_size if cache_size is not None else os.getenv("SQUAD_QUERY_CACHE_SIZE", 1024)),
+            ttl=float(cache_ttl if cache_ttl is not None else os.getenv("SQUAD_QUERY_CACHE_TTL", 3600)),
+        )
+        self.embedding_cache = LRUCache(maxsize=int(os.getenv("SQUAD_EMBEDDING_CACHE_SIZE", 4096)))
+        # Rephrasings of a recent query reuse its documents; lexical mode never embeds queries,
+        # so it only has the exact cache
+        self.semantic_cache = SemanticCache(
+            maxsize=int(os.getenv("SQUAD_SEMANTIC_CACHE_SIZE", 256)),
+            threshold=float(os.getenv("SQUAD_SEMANTIC_CACHE_THRESHOLD", 0.95)),
+        )
+        self.candidates = similarity_top_k if self.mode == "dense" else HYBRID_CANDIDATES
+        self.retriever = None
+        self.lexical = None
+        self.setup_lock = threading.Lock()
 
-    def forward(self, query: str) -> str:
-        assert isinstance(query, str), "Your search query must be a string"
+    def setup(self):
+        """
+        Loads the data and opens the indexes the retriever searches. This happens on the
+        first search, so creating the tool (e.g. importing agent) doesn't load them; the app
+        calls it at startup instead.
+        """
+        if self.is_initialized:
+            return
+        with self.setup_lock:
+            if self.is_initialized:
+                return
+            self.data = get_data(download=True)
+            if self.mode != "lexical":
+                if self.backend == "chroma":
+                    self.retriever = self.data.index.as_retriever(similarity_top_k=self.candidates)
+                else:
+                    self.retriever = VectorRetriever(
+                        self.data.vector_index(self.backend),
+                        similarity_top_k=self.candidates,
+                        embedding_cache=self.embedding_cache,
+                    )
+            if self.mode != "dense":
+                self.lexical = self.data.lexical_index()
+            self.is_initialized = True
 
-        responses = self.retriever.retrieve(query)
+    def chroma_filters(self, title, prefix):
+        from llama_index.core.vector_stores import MetadataFilters, MetadataFilter, FilterOperator
+        if not prefix:
+            return MetadataFilters(filters=[MetadataFilter(key="title", value=title)])
+        # Chroma has no prefix operator on metadata, so match the titles that start with it
+        titles = [t for t in self.data.titles() if t.startswith(title)]
+        if not titles:
+            return None
+        return MetadataFilters(filters=[MetadataFilter(key="title", value=titles, operator=FilterOperator.IN)])
 
-        if len(responses) == 0:
-            return "No documents found for this query."
-        return "===Document===\n" + "\n===Document===\n".join(
-            [
-                f"{response.text}\nScore: {response.score}"
-                for response in responses
+    def dense_retrieve(self, queries, title=None, prefix=False):
+        """Returns the vector search results of each query, embedding them all in one batch."""
+        if self.backend != "chroma":
+            return self.retriever.retrieve_batch(queries, title=title, prefix=prefix)
+        from llama_index.core import QueryBundle
+        retriever = self.retriever
+        if title is not None:
+            filters = self.chroma_filters(title, prefix)
+            if filters is None:
+                return [[] for _ in queries]
+            retriever = self.data.index.as_retriever(similarity_top_k=self.candidates, filters=filters)
+        embeddings = embed_queries(queries, cache=self.embedding_cache)
+        return [
+            retriever.retrieve(QueryBundle(query, embedding=embedding))
+            for query, embedding in zip(queries, embeddings)
+        ]
+
+    def retrieve(self, queries, title=None, prefix=False):
+        """Returns one result list per query."""
+        self.setup()
+        if self.mode == "lexical":
+            return [self.lexical.search(query, self.similarity_top_k, title=title, prefix=prefix) for query in queries]
+        results = self.dense_retrieve(queries, title, prefix)
+        if self.mode == "hybrid":
+            results = [
+                reciprocal_rank_fusion(
+                    [responses, self.lexical.search(query, HYBRID_CANDIDATES, title=title, prefix=prefix)],
+                    k=self.similarity_top_k,
+                )
+                for query, responses in zip(queries, results)
             ]
+        return results
+
+    def cached_retrieve(self, queries, title=None, prefix=False, counts=None):
+        """
+        Like retrieve, serving repeated queries from the exact cache, rephrased ones from the
+        semantic cache, and retrieving the rest together. The number of distinct queries served
+        by each is added to counts, if given, as cache_hits, semantic_hits and cache_misses.
+        """
+        keys = [(normalize_query(query), title, prefix) for query in queries]
+        results = {}
+        for key in keys:
+            if key not in results:
+                results[key] = self.cache.get(key)
+        missing = {key: query for query, key in zip(queries, keys) if results[key] is None}
+        exact_hits = len(results) - len(missing)
+        if missing and self.mode != "lexical" and self.semantic_cache.maxsize > 0:
+            embeddings = dict(zip(missing, embed_queries(list(missing.values()), cache=self.embedding_cache)))
+            for key in list(missing):
+                responses = self.semantic_cache.get(embeddings[key], key=(title, prefix))
+                if responses is not None:
+                    results[key] = responses
+                    self.cache.put(key, responses)
+                    del missing[key]
+        else:
+            embeddings = {}
+        if counts is not None:
+            counts["cache_hits"] = exact_hits
+            counts["semantic_hits"] = len(results) - exact_hits - len(missing)
+            counts["cache_misses"] = len(missing)
+        if missing:
+            for key, responses in zip(missing, self.retrieve(list(missing.values()), title, prefix)):
+                results[key] = responses
+                self.cache.put(key, responses)
+                if key in embeddings:
+                    self.semantic_cache.put(embeddings[key], responses, key=(title, prefix))
+        return [results[key] for key in keys]
+
+    def cache_stats(self):
+        return {
+            "results": self.cache.stats(),
+            "semantic": self.semantic_cache.stats(),
+            "embeddings": self.embedding_cache.stats(),
+        }
+
+    def record_tokens(self, queries, results, output):
+        """Counts the output's tokens against those of formatting each query's hits separately and in full."""
+        baseline = "\n".join(
+            format_responses(responses, query, max_qas=None) for query, responses in zip(queries, results)
         )
+        tokens = self.last_call_tokens = {"output": count_tokens(output), "baseline": count_tokens(baseline)}
+        self.token_stats["calls"] += 1
+        self.token_stats["output_tokens"] += tokens["output"]
+        self.token_stats["baseline_tokens"] += tokens["baseline"]
+        return tokens
+
+    def forward(self, query: str | list[str], title: str = None) -> str:
+        queries = [query] if isinstance(query, str) else list(query)
+        assert len(queries) > 0 and all(
+            isinstance(q, str) for q in queries
+        ), "Your search query must be a string or a list of strings"
+
+        title, prefix = parse_title(title)
+        with telemetry.span("squad_retriever", queries=len(queries), backend=self.backend, mode=self.mode) as span:
+            results = self.cached_retrieve(queries, title, prefix, counts=span)
+            output = format_results(queries, results, self.max_tokens)
+            span["output_tokens"] = self.record_tokens(queries, results, output)["output"]
+        return output
 
 
 class SquadQueryTool(Tool):
@@ -50,7 +312,7 @@ class SquadQueryTool(Tool):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.data = get_data(download=True)
+        self.data = None
         self.query_engine = self.data.index.as_query_engine()
 
     def forward(self, query: str) -> str:
@@ -1,20 +1,36 @@
 from __future__ import annotations
 
+import os
+import queue
+import logging
+import threading
 import gradio as gr
 from gradio import ChatMessage
 from transformers.agents import ReactCodeAgent, agent_types
-from typing import Generator
+from typing import Generator, NamedTuple
+from engines import stream_to
+from telemetry import telemetry
 from termcolor import colored
 from pygments import highlight
 from pygments.lexers import PythonLexer
 from pygments.formatters import HtmlFormatter
 from pygments.formatters import TerminalFormatter
 
+logger = logging.getLogger(__name__)
+
+# Code is highlighted at every step, so the lexer and formatters are only created once
+PYTHON_LEXER = PythonLexer()
+TERMINAL_FORMATTER = TerminalFormatter()
+HTML_FORMATTER = HtmlFormatter()
+
+# Echo the inner monologue, highlighted, to the log (at INFO); set SQUAD_ECHO_MONOLOGUE=0 in production
+ECHO_MONOLOGUE = os.getenv("SQUAD_ECHO_MONOLOGUE", "1") != "0"
+
 def highlight_code_terminal(text):
-    return highlight(text, PythonLexer(), TerminalFormatter())
+    return highlight(text, PYTHON_LEXER, TERMINAL_FORMATTER)
 
 def highlight_code_html(code):
-    return highlight(code, PythonLexer(), HtmlFormatter())
+    return highlight(code, PYTHON_LEXER, HTML_FORMATTER)
 
 
 def pull_message(step_log: dict):
@@ -29,10 +45,74 @@ def pull_message(step_log: dict):
     if step_log.get("error"):
         yield "💥 Coping with an Error...", step_log['error'].message
 
+class PartialOutput(NamedTuple):
+    """The LLM's output so far in the current step (rationale, then code), while it streams in."""
+    text: str
+
+
+class MonologueFragment(NamedTuple):
+    """A message added to the inner monologue, with its HTML, so clients can render just the new part."""
+    title: str
+    html: str
+
+
+def run_agent_in_thread(agent: ReactCodeAgent, prompt: str, reset: bool, trace: str | None = None):
+    """
+    Runs the agent on a worker thread, yielding ("partial", text) as the LLM's output streams
+    in, and ("step", step_log) after each step. Partial outputs that a newer one replaced
+    before they were read are skipped. The run is timed as an "agent_run" span of trace.
+    """
+    events = queue.Queue()
+
+    def work():
+        try:
+            with stream_to(lambda text: events.put(("partial", text))), telemetry.span("agent_run", trace=trace):
+                for step_log in agent.run(prompt, stream=True, reset=reset):
+                    events.put(("step", step_log))
+        except BaseException as e:
+            events.put(("error", e))
+        finally:
+            events.put(("done", None))
+
+    worker = threading.Thread(target=work, daemon=True)
+    worker.start()
+    try:
+        pending = None
+        while True:
+            kind, value = pending or events.get()
+            pending = None
+            while kind == "partial":
+                try:
+                    newer = events.get_nowait()
+                except queue.Empty:
+                    break
+                if newer[0] != "partial":
+                    pending = newer
+                    break
+                value = newer[1]
+            if kind == "done":
+                return
+            if kind == "error":
+                raise value
+            yield kind, value
+    finally:
+        # If the client went away mid-run, the agent is still busy: wait for it, so it isn't
+        # handed to another session while it runs
+        worker.join()
+
+
 def stream_from_transformers_agent(
-    agent: ReactCodeAgent, prompt: str
-) -> Generator[ChatMessage, None, ChatMessage | None]:
-    """Runs an agent with the given prompt and streams the messages from the agent as ChatMessages."""
+    agent: ReactCodeAgent, prompt: str, echo: bool | None = None, trace: str | None = None
+) -> Generator[ChatMessage | MonologueFragment | PartialOutput, None, ChatMessage | None]:
+    """
+    Runs an agent with the given prompt and streams the messages from the agent as ChatMessages,
+    with a MonologueFragment for each new inner monologue message, and PartialOutputs while the
+    LLM is generating. The inner monologue itself is joined from its fragments once, at the end.
+    echo (ECHO_MONOLOGUE by default) also logs the monologue, highlighted for the terminal.
+    The run and the rendering of each message are timed as spans of trace (a new one if None).
+    """
+    echo = ECHO_MONOLOGUE if echo is None else echo
+    trace = trace or telemetry.new_trace()
 
     class Output:
         output: agent_types.AgentType | str = None
@@ -43,21 +123,30 @@ def stream_from_transformers_agent(
         content="",
     )
 
+    fragments = []
     step_log = None
-    for step_log in agent.run(prompt, stream=True, reset=len(agent.logs) == 0): # Reset=False misbehaves if the agent has not yet been run
+    for kind, value in run_agent_in_thread(agent, prompt, reset=len(agent.logs) == 0, trace=trace): # Reset=False misbehaves if the agent has not yet been run
+        if kind == "partial":
+            yield PartialOutput(value)
+            continue
+        step_log = value
         if isinstance(step_log, dict):
             for title, message in pull_message(step_log):
-                terminal_message = message
-                if ("Using tool" in title) or ("Error" in title):
-                    terminal_message = highlight_code_terminal(message)
-                    message = highlight_code_html(message)
-                if "Observing" in title:
-                    message = "<div style='border:1px solid black; background-color: var(--code-background-fill); padding: 10px;'>{}</div>".format(message.replace('\n', '<br/>'))
-                print(colored("=== Inner Monologue Message:\n", "blue", attrs=["bold"]), f"{title}\n{terminal_message}")
-                inner_monologue.content += f"<h2>{title}</h2><p>{message}</p>"
-                yield title
+                with telemetry.span("render", trace=trace):
+                    is_code = ("Using tool" in title) or ("Error" in title)
+                    if echo and logger.isEnabledFor(logging.INFO):
+                        terminal_message = highlight_code_terminal(message) if is_code else message
+                        logger.info("%s\n%s\n%s", colored("=== Inner Monologue Message:", "blue", attrs=["bold"]), title, terminal_message)
+                    if is_code:
+                        message = highlight_code_html(message)
+                    if "Observing" in title:
+                        message = "<div style='border:1px solid black; background-color: var(--code-background-fill); padding: 10px;'>{}</div>".format(message.replace('\n', '<br/>'))
+                    fragment = f"<h2>{title}</h2><p>{message}</p>"
+                fragments.append(fragment)
+                yield MonologueFragment(title, fragment)
 
     if inner_monologue is not None:
+        inner_monologue.content = "".join(fragments)
         inner_monologue.metadata = {"title": "Inner Monologue (click to expand)"}
         yield inner_monologue
 